@@ -0,0 +1,410 @@
+"""time the hot paths of core.py and plot_elastic.py on synthetic data, so that
+slowdowns can be caught without downloading anything.  run it from anywhere:
+
+    python benchmark.py --output results.json
+    python benchmark.py --baseline results.json --threshold 0.2
+
+each benchmark is timed a few times (the fastest run counts), then run once more under
+tracemalloc to find its peak memory.  if a baseline is given, any benchmark that got
+slower by more than the threshold is reported and the script exits with status 1.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import zlib
+from datetime import datetime, timezone
+from functools import partial
+from pathlib import Path as FilePath
+
+import matplotlib
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+
+import core
+from core import (
+    ΦΛPoint,
+    PackedFeatures,
+    root_dir,
+    load_elastic_projection,
+    get_section_index,
+    project_points,
+    project,
+    cut_lines_that_cross_interruptions,
+    add_data_to_ax,
+)
+from plot_elastic import plot_elastic
+
+PROJECTIONS = ["elastic-II", "elastic-X"]
+SIZES = [10**3, 10**4, 10**5, 10**6]  # the numbers of points to try by default
+MAX_SIZE = 10**8  # the largest number of points it makes sense to try
+SEED = 0
+
+
+def make_random_points(size, rng):
+    """generate points spread uniformly over the globe"""
+    points = np.empty(size, dtype=ΦΛPoint)
+    points["latitude"] = np.degrees(np.arcsin(rng.uniform(-1, 1, size)))
+    points["longitude"] = rng.uniform(-180, 180, size)
+    return points
+
+
+def make_grid_points(size):
+    """generate the cell centers of a lat/lon raster with about this many cells"""
+    n_lat = max(1, round(np.sqrt(size / 2)))
+    n_lon = max(1, round(size / n_lat))
+    points = np.empty((n_lat, n_lon), dtype=ΦΛPoint)
+    points["latitude"] = -90 + (np.arange(n_lat)[:, np.newaxis] + 0.5) * 180 / n_lat
+    points["longitude"] = -180 + (np.arange(n_lon)[np.newaxis, :] + 0.5) * 360 / n_lon
+    return points.ravel()
+
+
+def make_synthetic_features(size, closed, rng):
+    """generate lines shaped roughly like Natural Earth data: wiggly loops (like lakes)
+    if closed, and meandering random walks (like coastlines and rivers) otherwise
+    :param size: the approximate total number of points
+    :return: a list of features, each a category, a width, and a list of lines of
+             latitudes and longitudes
+    """
+    features = []
+    num_points = 0
+    while num_points < size:
+        line_size = min(size - num_points, int(rng.integers(8, 400)))
+        if closed:
+            line_size = max(line_size, 4)
+            center_ф = np.degrees(np.arcsin(rng.uniform(-0.95, 0.95)))
+            center_λ = rng.uniform(-180, 180)
+            angle = np.linspace(0, 2 * np.pi, line_size, endpoint=False)
+            radius = rng.uniform(0.2, 5) * np.exp(
+                0.2 * np.cumsum(rng.normal(0, 0.1, line_size))
+            )
+            ф = center_ф + radius * np.sin(angle)
+            λ = center_λ + radius * np.cos(angle) / np.cos(np.radians(center_ф))
+        else:
+            line_size = max(line_size, 2)
+            start_ф = np.degrees(np.arcsin(rng.uniform(-0.95, 0.95)))
+            heading = np.cumsum(rng.normal(0, 0.3, line_size)) + rng.uniform(
+                0, 2 * np.pi
+            )
+            ф = start_ф + np.cumsum(0.1 * np.sin(heading))
+            λ = rng.uniform(-180, 180) + np.cumsum(0.1 * np.cos(heading))
+        line = np.empty(line_size, dtype=ΦΛPoint)
+        line["latitude"] = np.clip(ф, -90, 90)
+        line["longitude"] = (λ + 180) % 360 - 180
+        features.append((len(features) % 14, float(rng.uniform(0.5, 3)), [line]))
+        num_points += line_size
+    return features
+
+
+def measure(function, repeat):
+    """time a function and find how much memory it uses at its peak
+    :return: the fastest time it took (s) and the peak memory it allocated (bytes)
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        function()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(times), peak_memory
+
+
+def get_rng(*labels):
+    """make a random number generator for one benchmark’s input, seeded from SEED and
+    the input’s own labels, so that each input is the same no matter what else is being
+    run
+    """
+    return np.random.default_rng(
+        [SEED, zlib.crc32("/".join(map(str, labels)).encode())]
+    )
+
+
+def get_benchmarks(projection_name, sizes):
+    """list everything to time for one projection.  the inputs aren’t made until they’re
+    needed, so that benchmarks that get filtered out don’t cost anything.
+    :return: the name and setup function of each benchmark; calling the setup function
+             makes the inputs and returns the number of items processed and the function
+             to time
+    """
+    projection_path = root_dir / f"projection/{projection_name}.h5"
+    sections, _, _ = load_elastic_projection(projection_path)
+    get_section_index(
+        sections
+    )  # build this ahead of time so it doesn’t count against anything
+
+    def clear_and_load():
+        core._loaded_projections.clear()
+        load_elastic_projection(projection_path)
+
+    benchmarks = [
+        (
+            f"{projection_name}/load_elastic_projection/cold",
+            lambda: (1, clear_and_load),
+        ),
+        (
+            f"{projection_name}/load_elastic_projection/warm",
+            lambda: (1, lambda: load_elastic_projection(projection_path)),
+        ),
+    ]
+    for size in sizes:
+        for kind, make_points in [
+            (
+                "random",
+                lambda size=size: make_random_points(
+                    size, get_rng(projection_name, "random", size)
+                ),
+            ),
+            ("grid", lambda size=size: make_grid_points(size)),
+        ]:
+            make_points = remember_last(make_points)
+
+            def setup(function, make_points=make_points):
+                points = make_points()
+                return points.size, partial(function, points)
+
+            benchmarks += [
+                (
+                    f"{projection_name}/Section.contains/{kind}/{size}",
+                    partial(setup, sections[0].contains),
+                ),
+                (
+                    f"{projection_name}/Section.get_planar_coordinates/{kind}/{size}",
+                    partial(setup, sections[0].get_planar_coordinates),
+                ),
+                (
+                    f"{projection_name}/project_points/{kind}/{size}",
+                    partial(setup, lambda points: project_points(points, sections)),
+                ),
+            ]
+        # the line-based functions are too slow to be worth trying on the biggest sizes
+        if size > 10**6:
+            continue
+        for kind, closed in [("polygons", True), ("polylines", False)]:
+
+            @remember_last
+            def make_features(size=size, kind=kind, closed=closed):
+                features = make_synthetic_features(
+                    size, closed, get_rng(projection_name, kind, size)
+                )
+                packed = PackedFeatures.pack(features)
+                return packed, project(packed, sections)
+
+            def setup_project(make_features=make_features):
+                packed, _ = make_features()
+                return packed.points.size, lambda: project(packed, sections)
+
+            def setup_cut(make_features=make_features, closed=closed):
+                packed, projected = make_features()
+                return packed.points.size, lambda: cut_lines_that_cross_interruptions(
+                    projected, closed
+                )
+
+            benchmarks += [
+                (f"{projection_name}/project/{kind}/{size}", setup_project),
+                (
+                    f"{projection_name}/cut_lines_that_cross_interruptions/"
+                    f"{kind}/{size}",
+                    setup_cut,
+                ),
+            ]
+            if size <= 10**5:
+                style = (
+                    dict(facecolor="#335", edgecolor="#335", linewidth=0.2)
+                    if closed
+                    else dict(color="#fff", linewidth=0.2)
+                )
+
+                def setup_draw(make_features=make_features, closed=closed, style=style):
+                    packed, _ = make_features()
+                    return packed.points.size, lambda: draw_on_new_figure(
+                        add_data_to_ax, (packed, closed), style, 2, sections
+                    )
+
+                benchmarks.append(
+                    (f"{projection_name}/add_data_to_ax/{kind}/{size}", setup_draw)
+                )
+    for shape in [(180, 360), (720, 1440)]:
+        size = shape[0] * shape[1]
+        if size > max(sizes):
+            continue
+        make_raster = remember_last(
+            lambda shape=shape: np.exp(
+                get_rng(projection_name, "raster", *shape).normal(3, 2, shape)
+            )
+        )
+        for render_mode in ["scatter", "image"]:
+
+            def setup_plot(make_raster=make_raster, render_mode=render_mode):
+                raster = make_raster()
+                return raster.size, lambda: close_figure(
+                    plot_elastic(
+                        raster,
+                        projection_name=projection_name,
+                        resolution=1000,
+                        dpi=50,
+                        render_mode=render_mode,
+                        overlay_cache_dir=None,
+                    )
+                )
+
+            benchmarks.append(
+                (f"{projection_name}/plot_elastic/{render_mode}/{size}", setup_plot)
+            )
+    return benchmarks
+
+
+def remember_last(make):
+    """wrap a function with no arguments so that the benchmarks that share its result
+    reuse it, but only until some other input is made, so that only one is in memory at
+    a time
+    """
+
+    def wrapper():
+        if _last_input.get("maker") is not wrapper:
+            _last_input.clear()
+            _last_input.update(maker=wrapper, value=make())
+        return _last_input["value"]
+
+    return wrapper
+
+
+_last_input = {}
+
+
+def draw_on_new_figure(function, *args):
+    """draw something on an ax on a new figure, render it, and throw it away"""
+    fig, ax = plt.subplots(dpi=50)
+    function(ax, *args)
+    fig.canvas.draw()
+    plt.close(fig)
+
+
+def close_figure(ax):
+    """render the figure that an ax is on and throw it away"""
+    ax.figure.canvas.draw()
+    plt.close(ax.figure)
+
+
+def run_benchmarks(projection_names=PROJECTIONS, sizes=SIZES, repeat=3, pattern=None):
+    """time everything
+    :param pattern: a substring that the names of the benchmarks to run must contain, if
+                    any
+    :return: the time, throughput, and peak memory of each benchmark, keyed by its name
+    """
+    results = {}
+    for projection_name in projection_names:
+        for name, setup in get_benchmarks(projection_name, sizes):
+            if pattern is not None and pattern not in name:
+                continue
+            size, function = setup()
+            seconds, peak_memory = measure(function, repeat)
+            throughput = size / seconds if seconds > 0 else None
+            results[name] = dict(
+                seconds=seconds,
+                throughput=throughput,
+                peak_memory=peak_memory,
+                size=size,
+            )
+            throughput_text = (
+                f"{throughput:12.4g}" if throughput is not None else f"{'-':>12s}"
+            )
+            print(
+                f"{name:<80s} {seconds:10.4f} s {throughput_text} /s "
+                f"{peak_memory / 1e6:10.1f} MB",
+                flush=True,
+            )
+    return results
+
+
+def compare_to_baseline(results, baseline, threshold):
+    """find the benchmarks that got slower
+    :param threshold: the fraction by which a benchmark can slow down before it counts
+    :return: the name, baseline time, and new time of each benchmark that got too slow
+    """
+    regressions = []
+    for name, result in results.items():
+        if name in baseline:
+            old_seconds = baseline[name]["seconds"]
+            if result["seconds"] > old_seconds * (1 + threshold):
+                regressions.append((name, old_seconds, result["seconds"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--projections", nargs="+", default=PROJECTIONS)
+    parser.add_argument(
+        "--sizes",
+        nargs="+",
+        type=float,
+        default=SIZES,
+        help=f"the numbers of points to try (at most {MAX_SIZE:.0e})",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", help="only run benchmarks whose names contain this")
+    parser.add_argument(
+        "--output", type=FilePath, help="where to save the results as JSON"
+    )
+    parser.add_argument(
+        "--baseline", type=FilePath, help="a previous --output to compare to"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="the fractional slowdown that counts as a regression",
+    )
+    args = parser.parse_args()
+    sizes = sorted(int(size) for size in args.sizes)
+    if sizes[-1] > MAX_SIZE:
+        parser.error(f"the sizes can’t be more than {MAX_SIZE:.0e}")
+
+    # plot_elastic looks for the projections relative to this folder
+    os.chdir(FilePath(__file__).resolve().parent)
+    results = run_benchmarks(args.projections, sizes, args.repeat, args.only)
+
+    if args.output is not None:
+        args.output.write_text(
+            json.dumps(
+                dict(
+                    metadata=dict(
+                        time=datetime.now(timezone.utc).isoformat(),
+                        python=sys.version,
+                        numpy=np.__version__,
+                        platform=platform.platform(),
+                        processor=platform.processor(),
+                        jit=core.numba is not None,
+                        repeat=args.repeat,
+                    ),
+                    results=results,
+                ),
+                indent=1,
+            )
+        )
+
+    if args.baseline is not None:
+        baseline = json.loads(args.baseline.read_text())["results"]
+        regressions = compare_to_baseline(results, baseline, args.threshold)
+        for name, old_seconds, new_seconds in regressions:
+            print(
+                f"SLOWER: {name} went from {old_seconds:.4f} s to {new_seconds:.4f} s "
+                f"({new_seconds / old_seconds - 1:+.0%})"
+            )
+        if len(regressions) > 0:
+            sys.exit(1)
+        print(f"no benchmarks got more than {args.threshold:.0%} slower")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,57 @@
 import numpy as np
+from numpy import newaxis
 from numpy.typing import NDArray
 from typing import Any
-from scipy import interpolate
+from matplotlib import rcParams
+from matplotlib.collections import LineCollection, PathCollection
 from matplotlib.path import Path
-from matplotlib.patches import PathPatch
+from matplotlib.transforms import Bbox
+from scipy.spatial import cKDTree
 import h5py
 import shapefile
-from math import nan
+from math import ceil, inf, nan
 from pathlib import Path as FilePath
+import atexit
+import hashlib
+import io
+import json
+import os
 import shutil
-from typing import Optional
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Iterable, Iterator, Optional
+
+from instrumentation import stage, log
+
+try:
+    import numba
+except ImportError:  # the JIT backend is optional; we fall back to NumPy without it
+    numba = None
 # TODO: import this stuff in create_example_maps
 
 SNIPPING_LENGTH = 1000
+MIN_SIMPLIFIED_VERTICES = (
+    128  # the fewest vertices a matplotlib Path must have to get simplified
+)
+# how far apart two Sections can put a point and still meet continuously there (km)
+SEAM_TOLERANCE = 50
+INDEX_RESOLUTION = 0.5  # the size of the cells in a SectionIndex (deg)
+CHUNK_SIZE = 1_000_000  # the number of points to interpolate at a time
+PARALLEL_THRESHOLD = 1_000_000  # the fewest points worth sending to other processes
+COMPILED_SUFFIX = ".compiled"  # the file extension of compiled projection files
+COMPILED_MAGIC = b"ELASTIC\x01"  # the first bytes of a compiled projection file
+OVERLAY_CACHE_SIZE = (
+    1_000_000_000  # the most space the overlay cache may take up (bytes)
+)
+# bump this whenever the cached overlays (projected, cut, or simplified) change
+OVERLAY_CACHE_VERSION = 2
+# the number of points along each side of a viewport to sample to find what’s in it
+VIEWPORT_SAMPLES = 200
+# how far outside the sampled points something can be and still be in a viewport (deg)
+VIEWPORT_MARGIN = 1.0
 
 Style = dict[str, Any]
 XYPoint = np.dtype([("x", float), ("y", float)])
@@ -23,8 +62,11 @@ XYFeature = tuple[int, float, list[XYLine]]
 ΦΛFeature = tuple[int, float, list[ΦΛLine]]
 
 root_dir = FilePath(__file__).parent.parent.parent.resolve()
+OVERLAY_CACHE_DIR = root_dir / "untracked/overlay_cache"
+REGRIDDING_CACHE_DIR = root_dir / "untracked/regridding_cache"
+
+log(f"root directory: {root_dir}")
 
-print(root_dir)
 
 class Section:
     def __init__(
@@ -33,6 +75,7 @@ class Section:
         λ_nodes: NDArray[float],
         xy_nodes: NDArray[XYPoint],
         border: ΦΛLine,
+        border_is_counterclockwise: Optional[bool] = None,
     ):
         """one lobe of an Elastic projection, containing a grid of latitudes and
         longitudes as well as the corresponding x and y coordinates
@@ -40,22 +83,47 @@ class Section:
         :param λ_nodes: the node longitudes (deg)
         :param xy_nodes: the grid of x- and y-values at each ф and λ (km)
         :param border: the path that encloses the region this section defines (d"eg)
+        :param border_is_counterclockwise: the orientation of the border, if it’s
+                                           already known
         """
-        self.x_projector = interpolate.RegularGridInterpolator(
-            (ф_nodes, λ_nodes), xy_nodes["x"]
-        )
-        self.y_projector = interpolate.RegularGridInterpolator(
-            (ф_nodes, λ_nodes), xy_nodes["y"]
-        )
-        self.border = Path(np.stack([border["latitude"], border["longitude"]], axis=-1))  # type: ignore
-        self.border_is_counterclockwise = is_counterclockwise(self.border)
+        # the interpolator and the border path are only built when first needed, so that
+        # sections loaded from memory-mapped files don’t read their grids until a point
+        # lands in them
+        self.ф_nodes = ф_nodes
+        self.λ_nodes = λ_nodes
+        self.xy_nodes = xy_nodes
+        self.border_points = border
+        self._projector: Optional[BilinearInterpolator] = None
+        self._border: Optional[Path] = None
+        self._border_is_counterclockwise = border_is_counterclockwise
+
+    @property
+    def projector(self) -> "BilinearInterpolator":
+        if self._projector is None:
+            self._projector = BilinearInterpolator(
+                self.ф_nodes, self.λ_nodes, self.xy_nodes
+            )
+        return self._projector
+
+    @property
+    def border(self) -> Path:
+        if self._border is None:
+            vertices = np.stack(
+                [self.border_points["latitude"], self.border_points["longitude"]],
+                axis=-1,
+            )
+            self._border = Path(vertices)  # type: ignore
+        return self._border
+
+    @property
+    def border_is_counterclockwise(self) -> bool:
+        if self._border_is_counterclockwise is None:
+            self._border_is_counterclockwise = is_counterclockwise(self.border)
+        return self._border_is_counterclockwise
 
     def get_planar_coordinates(self, points: NDArray[ΦΛPoint]) -> NDArray[XYPoint]:
         """take a point on the sphere and smoothly interpolate it to x and y"""
-        result = np.empty(points.size, dtype=XYPoint)
-        result["x"] = self.x_projector((points["latitude"], points["longitude"]))
-        result["y"] = self.y_projector((points["latitude"], points["longitude"]))
-        return result
+        return self.projector(points)
 
     def contains(self, points: NDArray[ΦΛPoint]) -> NDArray[bool]:
         """whether the given point is within this Section’s boundary"""
@@ -69,25 +137,1036 @@ class Section:
             return ~self.border.contains_points(points, radius=1e-9)  # type: ignore
 
 
+class BilinearInterpolator:
+    def __init__(
+        self,
+        ф_nodes: NDArray[float],
+        λ_nodes: NDArray[float],
+        xy_nodes: NDArray[XYPoint],
+        use_jit: Optional[bool] = None,
+    ):
+        """a linear interpolator on a regular grid that does x and y together, so that
+        the bracket search and the weights are only computed once for each point.  it
+        gives the same results as a pair of scipy RegularGridInterpolators.
+        :param ф_nodes: the node latitudes (deg)
+        :param λ_nodes: the node longitudes (deg)
+        :param xy_nodes: the grid of x- and y-values at each ф and λ (km)
+        :param use_jit: whether to use the Numba kernel; by default it’s used if Numba
+                        is installed
+        """
+        self.ф_nodes = np.ascontiguousarray(ф_nodes, dtype=float)
+        self.λ_nodes = np.ascontiguousarray(λ_nodes, dtype=float)
+        self.x_nodes = np.ascontiguousarray(xy_nodes["x"], dtype=float)
+        self.y_nodes = np.ascontiguousarray(xy_nodes["y"], dtype=float)
+        if use_jit is None:
+            use_jit = numba is not None
+        elif use_jit and numba is None:
+            raise ImportError("the JIT backend requires Numba, which is not installed")
+        self.use_jit = use_jit
+
+    def __call__(
+        self,
+        points: NDArray[ΦΛPoint],
+        out: Optional[NDArray[XYPoint]] = None,
+        chunk_size: int = CHUNK_SIZE,
+    ) -> NDArray[XYPoint]:
+        """interpolate x and y at the given points
+        :param points: the latitudes and longitudes at which to interpolate (deg)
+        :param out: the array in which to put the result, if you’ve already allocated
+                    one
+        :param chunk_size: the maximum number of points to process at once, which bounds
+                           the size of the temporary arrays
+        :return: the x and y coordinates of each point (km)
+        """
+        points = points.ravel()
+        if out is None:
+            out = empty_points_like(points, XYPoint)
+        elif out.shape != points.shape:
+            raise ValueError(
+                f"the output array has shape {out.shape} but there are "
+                f"{points.size} points"
+            )
+        for start in range(0, points.size, chunk_size):
+            stop = min(start + chunk_size, points.size)
+            ф = points["latitude"][start:stop]
+            λ = points["longitude"][start:stop]
+            for dimension, (nodes, values) in enumerate(
+                [(self.ф_nodes, ф), (self.λ_nodes, λ)]
+            ):
+                if np.any(values < nodes[0]) or np.any(values > nodes[-1]):
+                    raise ValueError(
+                        f"One of the requested xi is out of bounds in dimension "
+                        f"{dimension}"
+                    )
+            if self.use_jit:
+                _interpolate_bilinear_jit(
+                    self.ф_nodes,
+                    self.λ_nodes,
+                    self.x_nodes,
+                    self.y_nodes,
+                    ф,
+                    λ,
+                    out["x"][start:stop],
+                    out["y"][start:stop],
+                )
+            else:
+                _interpolate_bilinear_numpy(
+                    self.ф_nodes,
+                    self.λ_nodes,
+                    self.x_nodes,
+                    self.y_nodes,
+                    ф,
+                    λ,
+                    out["x"][start:stop],
+                    out["y"][start:stop],
+                )
+        return out
+
+
+def _interpolate_bilinear_numpy(ф_nodes, λ_nodes, x_nodes, y_nodes, ф, λ, x_out, y_out):
+    """the NumPy implementation of BilinearInterpolator; it writes into x_out, y_out"""
+    # find the cell of each point the same way scipy does, so it treats nodes the same
+    i = np.clip(np.searchsorted(ф_nodes, ф, side="right") - 1, 0, ф_nodes.size - 2)
+    j = np.clip(np.searchsorted(λ_nodes, λ, side="right") - 1, 0, λ_nodes.size - 2)
+    t = (ф - ф_nodes[i]) / (ф_nodes[i + 1] - ф_nodes[i])
+    u = (λ - λ_nodes[j]) / (λ_nodes[j + 1] - λ_nodes[j])
+    # then compute the weights once and use them for both coordinates
+    weights = [(1 - t) * (1 - u), (1 - t) * u, t * (1 - u), t * u]
+    corners = [(i, j), (i, j + 1), (i + 1, j), (i + 1, j + 1)]
+    for nodes, result in [(x_nodes, x_out), (y_nodes, y_out)]:
+        result[:] = 0
+        for weight, corner in zip(weights, corners):
+            result += weight * nodes[corner]
+
+
+if numba is not None:
+
+    @numba.njit(nogil=True, cache=True)
+    def _interpolate_bilinear_jit(
+        ф_nodes, λ_nodes, x_nodes, y_nodes, ф, λ, x_out, y_out
+    ):
+        """the Numba version of BilinearInterpolator; it writes into x_out, y_out"""
+        for k in range(ф.size):
+            i = min(
+                max(np.searchsorted(ф_nodes, ф[k], side="right") - 1, 0),
+                ф_nodes.size - 2,
+            )
+            j = min(
+                max(np.searchsorted(λ_nodes, λ[k], side="right") - 1, 0),
+                λ_nodes.size - 2,
+            )
+            t = (ф[k] - ф_nodes[i]) / (ф_nodes[i + 1] - ф_nodes[i])
+            u = (λ[k] - λ_nodes[j]) / (λ_nodes[j + 1] - λ_nodes[j])
+            w00 = (1 - t) * (1 - u)
+            w01 = (1 - t) * u
+            w10 = t * (1 - u)
+            w11 = t * u
+            x_out[k] = (
+                w00 * x_nodes[i, j]
+                + w01 * x_nodes[i, j + 1]
+                + w10 * x_nodes[i + 1, j]
+                + w11 * x_nodes[i + 1, j + 1]
+            )
+            y_out[k] = (
+                w00 * y_nodes[i, j]
+                + w01 * y_nodes[i, j + 1]
+                + w10 * y_nodes[i + 1, j]
+                + w11 * y_nodes[i + 1, j + 1]
+            )
+
+else:
+    _interpolate_bilinear_jit = None
+
+
+class SectionIndex:
+    NO_SECTION = -1
+    AMBIGUOUS = -2
+
+    def __init__(
+        self,
+        sections: list[Section],
+        resolution: float = INDEX_RESOLUTION,
+        owners: Optional[NDArray[np.int8]] = None,
+    ):
+        """a lookup grid that says which Section owns each point on the globe.  every
+        cell of the grid is assigned either to a single section, to no section, or (if
+        any border passes thru or near it) marked as ambiguous, in which case its points
+        get the exact polygon tests.  where sections overlap, the last one wins, same as
+        when you assign to each section in turn.
+        :param sections: the sections of the projection, in order
+        :param resolution: the size of each square cell of the lookup grid (deg)
+        :param owners: the precomputed lookup grid, if you already have it
+        """
+        self.sections = sections
+        self.resolution = resolution
+        self.shape = (ceil(180 / resolution), ceil(360 / resolution))
+        if owners is not None:
+            assert owners.shape == self.shape
+            self.owners = owners
+            return
+        cell_centers = np.empty(self.shape, dtype=ΦΛPoint)
+        cell_centers["latitude"] = (
+            -90 + (np.arange(self.shape[0])[:, newaxis] + 0.5) * resolution
+        )
+        cell_centers["longitude"] = (
+            -180 + (np.arange(self.shape[1])[newaxis, :] + 0.5) * resolution
+        )
+        self.owners = np.full(self.shape, SectionIndex.NO_SECTION, dtype=np.int8)
+        near_a_border = np.full(self.shape, False)
+        for h, section in enumerate(sections):
+            self.owners[section.contains(cell_centers.ravel()).reshape(self.shape)] = h
+            near_a_border |= self._cells_touched_by(section.border.vertices)
+        self.owners[near_a_border] = SectionIndex.AMBIGUOUS
+
+    def _cells_touched_by(self, vertices: NDArray[float]) -> NDArray[bool]:
+        """find every cell that a closed polygon passes thru or comes within a hair of.
+        this is conservative: it may include a few extra cells, but it never misses one.
+        :param vertices: the (n, 2) array of latitudes and longitudes of the polygon
+                         (deg)
+        """
+        vertices = np.concatenate([vertices, vertices[:1]])
+        # densify the polygon so that consecutive samples are at most half a cell apart
+        steps = np.ceil(
+            np.max(np.abs(np.diff(vertices, axis=0)), axis=1) / (self.resolution / 2)
+        )
+        steps = np.maximum(1, steps).astype(int)
+        segment = np.repeat(np.arange(steps.size), steps)
+        fraction = (
+            np.arange(segment.size) - np.repeat(np.cumsum(steps) - steps, steps)
+        ) / steps[segment]
+        samples = vertices[segment] + fraction[:, newaxis] * (
+            vertices[segment + 1] - vertices[segment]
+        )
+        samples = np.concatenate([samples, vertices[-1:]])
+        # every point on the polygon is within a quarter cell of a sample, so mark all
+        # cells that come within a quarter cell (plus some tolerance for the radius
+        # used in Section.contains)
+        margin = self.resolution / 4 + 1e-6
+        touched = np.full(self.shape, False)
+        for dф in [-margin, margin]:
+            for dλ in [-margin, margin]:
+                i = np.floor((samples[:, 0] + dф + 90) / self.resolution).astype(int)
+                j = np.floor((samples[:, 1] + dλ + 180) / self.resolution).astype(int)
+                touched[
+                    np.clip(i, 0, self.shape[0] - 1), np.clip(j, 0, self.shape[1] - 1)
+                ] = True
+        return touched
+
+    def locate(self, points: NDArray[ΦΛPoint]) -> NDArray[int]:
+        """find the index of the Section that should project each point, in a single
+        pass
+        :param points: the latitudes and longitudes to look up (deg)
+        :return: the index of each point’s section, or SectionIndex.NO_SECTION if none
+                 contains it
+        """
+        ф = points["latitude"]
+        λ = points["longitude"]
+        in_range = (ф >= -90) & (ф <= 90) & (λ >= -180) & (λ <= 180)
+        i = np.floor((np.where(in_range, ф, 0) + 90) / self.resolution).astype(int)
+        j = np.floor((np.where(in_range, λ, 0) + 180) / self.resolution).astype(int)
+        owners = self.owners[
+            np.minimum(i, self.shape[0] - 1), np.minimum(j, self.shape[1] - 1)
+        ].astype(int)
+        owners[~in_range] = SectionIndex.AMBIGUOUS
+        # fall back to the exact polygon tests for points near a border
+        ambiguous = np.nonzero(owners == SectionIndex.AMBIGUOUS)[0]
+        if ambiguous.size > 0:
+            ambiguous_owners = np.full(ambiguous.size, SectionIndex.NO_SECTION)
+            for h, section in enumerate(self.sections):
+                ambiguous_owners[section.contains(points[ambiguous])] = h
+            owners[ambiguous] = ambiguous_owners
+        return owners
+
+
+_cache_lock = threading.Lock()  # guards the entries of every SectionCache
+
+
+class SectionCache:
+    def __init__(
+        self, max_size: int = 8, on_evict: Optional[Callable[[Any], None]] = None
+    ):
+        """a small cache of things worked out from a list of Sections.  Sections can’t
+        be hashed by value, so each entry is keyed by the identity of its Sections (plus
+        whatever else it depends on), and it holds on to them so that their ids can’t be
+        reused while it’s here.  only the max_size most recently added entries are kept.
+        the entries are guarded by one lock that’s only held to look things up and put
+        them in; building an entry happens outside it, under a lock for just that key,
+        so that threads asking for the same thing at once don’t each build it but
+        threads asking for other things don’t have to wait.
+        :param max_size: the most entries to keep
+        :param on_evict: a function to call on each entry that gets dropped or cleared,
+                         if it needs cleaning up
+        """
+        self.max_size = max_size
+        self.on_evict = on_evict
+        self._entries: dict[tuple, tuple[tuple[Section, ...], Any]] = {}
+        self._build_locks: dict[tuple, tuple[threading.Lock, int]] = {}
+
+    @staticmethod
+    def _get_key(sections: tuple[Section, ...], key: tuple) -> tuple:
+        return (tuple(id(section) for section in sections), *key)
+
+    def get(self, sections: Iterable[Section], *key: Any) -> Optional[Any]:
+        """look up the entry for some sections, or return None if there isn’t one"""
+        full_key = SectionCache._get_key(tuple(sections), key)
+        with _cache_lock:
+            entry = self._entries.get(full_key)
+            return entry[1] if entry is not None else None
+
+    def put(self, sections: Iterable[Section], value: Any, *key: Any) -> None:
+        """add or replace the entry for some sections, dropping the oldest if full"""
+        sections = tuple(sections)
+        evicted = []
+        with _cache_lock:
+            self._entries[SectionCache._get_key(sections, key)] = (sections, value)
+            while len(self._entries) > self.max_size:
+                evicted.append(self._entries.pop(next(iter(self._entries)))[1])
+        if self.on_evict is not None:
+            for value in evicted:
+                self.on_evict(value)
+
+    def get_or_build(self, sections: Iterable[Section], build, *key: Any) -> Any:
+        """look up the entry for some sections, calling build() to make it if needed"""
+        sections = tuple(sections)
+        full_key = SectionCache._get_key(sections, key)
+        with _cache_lock:
+            entry = self._entries.get(full_key)
+            if entry is not None:
+                return entry[1]
+            build_lock, num_waiting = self._build_locks.get(
+                full_key, (threading.Lock(), 0)
+            )
+            self._build_locks[full_key] = (build_lock, num_waiting + 1)
+        try:
+            with build_lock:
+                # someone else may have built it while we were waiting
+                value = self.get(sections, *key)
+                if value is None:
+                    value = build()
+                    self.put(sections, value, *key)
+                return value
+        finally:
+            with _cache_lock:
+                build_lock, num_waiting = self._build_locks[full_key]
+                if num_waiting > 1:
+                    self._build_locks[full_key] = (build_lock, num_waiting - 1)
+                else:
+                    del self._build_locks[full_key]
+
+    def clear(self) -> None:
+        """forget every entry"""
+        with _cache_lock:
+            evicted = [value for _, value in self._entries.values()]
+            self._entries.clear()
+        if self.on_evict is not None:
+            for value in evicted:
+                self.on_evict(value)
+
+
+_section_indices = SectionCache()
+
+
+def get_section_index(sections: list[Section]) -> SectionIndex:
+    """get the SectionIndex for the given sections, building it only if needed"""
+    return _section_indices.get_or_build(sections, lambda: SectionIndex(sections))
+
+
+class InverseProjection:
+    def __init__(self, sections: list[Section], boundary: XYLine):
+        """the inverse of an Elastic projection, which takes x and y back to latitude
+        and longitude.  it keeps a bucket grid over the projected plane that says which
+        cells of which sections’ node grids might contain each point, and then solves
+        for the point’s position within each candidate cell with Newton’s method.
+        :param sections: the sections that comprise the projection
+        :param boundary: the map’s full projected outer shape (km)
+        """
+        self.sections = sections
+        self.boundary = Path(np.stack([boundary["x"], boundary["y"]], axis=-1))
+        # collect every cell of every section whose corners are all defined
+        section_indices, cell_i, cell_j = [], [], []
+        for h, section in enumerate(sections):
+            x_nodes = section.projector.x_nodes
+            is_defined = np.isfinite(x_nodes)
+            is_defined = (
+                is_defined[:-1, :-1]
+                & is_defined[:-1, 1:]
+                & is_defined[1:, :-1]
+                & is_defined[1:, 1:]
+            )
+            i, j = np.nonzero(is_defined)
+            section_indices.append(np.full(i.size, h))
+            cell_i.append(i)
+            cell_j.append(j)
+        self.cell_section = np.concatenate(section_indices)
+        self.cell_i = np.concatenate(cell_i)
+        self.cell_j = np.concatenate(cell_j)
+        corners = self._get_corners(np.arange(self.cell_section.size))
+        self.x_min = x_min = np.min([corner["x"] for corner in corners], axis=0)
+        self.x_max = x_max = np.max([corner["x"] for corner in corners], axis=0)
+        self.y_min = y_min = np.min([corner["y"] for corner in corners], axis=0)
+        self.y_max = y_max = np.max([corner["y"] for corner in corners], axis=0)
+
+        # build a grid of buckets roughly the size of a typical cell
+        self.bucket_size = np.median(np.maximum(x_max - x_min, y_max - y_min))
+        self.origin = (np.min(x_min), np.min(y_min))
+        self.shape = (
+            int(ceil((np.max(x_max) - self.origin[0]) / self.bucket_size)) + 1,
+            int(ceil((np.max(y_max) - self.origin[1]) / self.bucket_size)) + 1,
+        )
+        i_min, j_min = self._get_bucket(x_min, y_min)
+        i_max, j_max = self._get_bucket(x_max, y_max)
+        # register each cell in every bucket its bounding box touches
+        widths = j_max - j_min + 1
+        counts = (i_max - i_min + 1) * widths
+        cells = np.repeat(np.arange(counts.size), counts)
+        k = np.arange(cells.size) - np.repeat(np.cumsum(counts) - counts, counts)
+        buckets = (i_min[cells] + k // widths[cells]) * self.shape[1] + (
+            j_min[cells] + k % widths[cells]
+        )
+        order = np.argsort(buckets, kind="stable")
+        self.bucket_cells = cells[order]
+        self.bucket_offsets = np.searchsorted(
+            buckets[order], np.arange(self.shape[0] * self.shape[1] + 1)
+        )
+
+    def _get_bucket(
+        self, x: NDArray[float], y: NDArray[float]
+    ) -> tuple[NDArray[int], NDArray[int]]:
+        """find the indices of the buckets containing these x and y values"""
+        i = np.floor((x - self.origin[0]) / self.bucket_size).astype(int)
+        j = np.floor((y - self.origin[1]) / self.bucket_size).astype(int)
+        return i, j
+
+    def _get_corners(self, cells: NDArray[int]) -> list[NDArray[XYPoint]]:
+        """get the projected corners of the given cells, in the order (i, j),
+        (i, j + 1), (i + 1, j), (i + 1, j + 1)
+        """
+        corners = [np.empty(cells.size, dtype=XYPoint) for _ in range(4)]
+        for h, section in enumerate(self.sections):
+            in_this_section = self.cell_section[cells] == h
+            i = self.cell_i[cells[in_this_section]]
+            j = self.cell_j[cells[in_this_section]]
+            for corner, (di, dj) in zip(corners, [(0, 0), (0, 1), (1, 0), (1, 1)]):
+                corner["x"][in_this_section] = section.projector.x_nodes[i + di, j + dj]
+                corner["y"][in_this_section] = section.projector.y_nodes[i + di, j + dj]
+        return corners
+
+    def __call__(
+        self, points: NDArray[XYPoint], chunk_size: int = CHUNK_SIZE
+    ) -> tuple[NDArray[ΦΛPoint], NDArray[bool]]:
+        """find the latitudes and longitudes that project to the given points
+        :param points: the x and y coordinates to invert (km)
+        :param chunk_size: the maximum number of points to process at once
+        :return: the latitude and longitude of each point (deg), which will be NaN for
+                 points outside of the map, and a bool array indicating which points are
+                 inside the map
+        """
+        points = points.ravel()
+        result = np.empty(points.size, dtype=ΦΛPoint)
+        for start in range(0, points.size, chunk_size):
+            stop = min(start + chunk_size, points.size)
+            result[start:stop] = self._invert_chunk(points[start:stop])
+        inside = ~np.isnan(result["latitude"])
+        return result, inside
+
+    def _invert_chunk(self, points: NDArray[XYPoint]) -> NDArray[ΦΛPoint]:
+        result = np.empty(points.size, dtype=ΦΛPoint)
+        result[:] = (nan, nan)
+        # find every candidate cell for every point
+        i, j = self._get_bucket(points["x"], points["y"])
+        in_grid = (i >= 0) & (i < self.shape[0]) & (j >= 0) & (j < self.shape[1])
+        buckets = np.where(in_grid, i * self.shape[1] + j, 0)
+        counts = np.where(
+            in_grid, self.bucket_offsets[buckets + 1] - self.bucket_offsets[buckets], 0
+        )
+        pair_point = np.repeat(np.arange(points.size), counts)
+        k = np.arange(pair_point.size) - np.repeat(np.cumsum(counts) - counts, counts)
+        pair_cell = self.bucket_cells[self.bucket_offsets[buckets[pair_point]] + k]
+        # skip any cells whose bounding boxes don’t actually contain the point
+        x, y = points["x"][pair_point], points["y"][pair_point]
+        in_box = (
+            (x >= self.x_min[pair_cell])
+            & (x <= self.x_max[pair_cell])
+            & (y >= self.y_min[pair_cell])
+            & (y <= self.y_max[pair_cell])
+        )
+        pair_point, pair_cell = pair_point[in_box], pair_cell[in_box]
+
+        # solve for the position of each point within each of its candidate cells
+        t, u = self._solve_bilinear(points[pair_point], pair_cell)
+        tolerance = 1e-9
+        in_cell = (
+            (t >= -tolerance)
+            & (t <= 1 + tolerance)
+            & (u >= -tolerance)
+            & (u <= 1 + tolerance)
+        )
+        pair_point, pair_cell, t, u = (
+            pair_point[in_cell],
+            pair_cell[in_cell],
+            t[in_cell],
+            u[in_cell],
+        )
+        candidates = np.empty(pair_point.size, dtype=ΦΛPoint)
+        for h, section in enumerate(self.sections):
+            in_this_section = self.cell_section[pair_cell] == h
+            ф_nodes, λ_nodes = section.projector.ф_nodes, section.projector.λ_nodes
+            i = self.cell_i[pair_cell[in_this_section]]
+            j = self.cell_j[pair_cell[in_this_section]]
+            candidates["latitude"][in_this_section] = ф_nodes[i] + np.clip(
+                t[in_this_section], 0, 1
+            ) * (ф_nodes[i + 1] - ф_nodes[i])
+            candidates["longitude"][in_this_section] = λ_nodes[j] + np.clip(
+                u[in_this_section], 0, 1
+            ) * (λ_nodes[j + 1] - λ_nodes[j])
+
+        # a cell can stick out past its section’s border, so only trust solutions in the
+        # section that would project them forward; otherwise, fall back to checking the
+        # map’s outer edge
+        owns_solution = (
+            get_section_index(self.sections).locate(candidates)
+            == self.cell_section[pair_cell]
+        )
+        for acceptable in [owns_solution, ~owns_solution]:
+            unsolved = np.isnan(result["latitude"][pair_point])
+            pairs = np.nonzero(acceptable & unsolved)[0]
+            if pairs.size == 0:
+                continue
+            points_solved, first_pair = np.unique(pair_point[pairs], return_index=True)
+            pairs = pairs[first_pair]
+            if acceptable is not owns_solution:
+                on_map = self.boundary.contains_points(
+                    np.stack(
+                        [points["x"][points_solved], points["y"][points_solved]],
+                        axis=-1,
+                    )
+                )
+                points_solved, pairs = points_solved[on_map], pairs[on_map]
+            result[points_solved] = candidates[pairs]
+        return result
+
+    def _solve_bilinear(
+        self, points: NDArray[XYPoint], cells: NDArray[int], iterations: int = 8
+    ) -> tuple[NDArray[float], NDArray[float]]:
+        """find the normalized coordinates of each point within a cell using Newton’s
+        method
+        :return: the position along the latitude axis and the position along the
+                 longitude axis, which will both be between 0 and 1 if the point is in
+                 the cell (or NaN if it didn’t converge)
+        """
+        p00, p01, p10, p11 = self._get_corners(cells)
+        # write the bilinear patch as a + b t + c u + d t u
+        a_x, a_y = p00["x"] - points["x"], p00["y"] - points["y"]
+        b_x, b_y = p10["x"] - p00["x"], p10["y"] - p00["y"]
+        c_x, c_y = p01["x"] - p00["x"], p01["y"] - p00["y"]
+        d_x, d_y = p11["x"] - p10["x"] - c_x, p11["y"] - p10["y"] - c_y
+        t = np.full(cells.size, 0.5)
+        u = np.full(cells.size, 0.5)
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            for _ in range(iterations):
+                residual_x = a_x + b_x * t + c_x * u + d_x * t * u
+                residual_y = a_y + b_y * t + c_y * u + d_y * t * u
+                dx_dt, dy_dt = b_x + d_x * u, b_y + d_y * u
+                dx_du, dy_du = c_x + d_x * t, c_y + d_y * t
+                determinant = dx_dt * dy_du - dy_dt * dx_du
+                t = t - (dy_du * residual_x - dx_du * residual_y) / determinant
+                u = u - (dx_dt * residual_y - dy_dt * residual_x) / determinant
+            residual_x = a_x + b_x * t + c_x * u + d_x * t * u
+            residual_y = a_y + b_y * t + c_y * u + d_y * t * u
+            converged = np.hypot(residual_x, residual_y) < 1e-6
+        t[~converged] = nan
+        u[~converged] = nan
+        return t, u
+
+
+_inverse_projections = SectionCache()
+
+
+def inverse_project_points(
+    points: NDArray[XYPoint], projection: list[Section], boundary: XYLine
+) -> tuple[NDArray[ΦΛPoint], NDArray[bool]]:
+    """apply the inverse of the given Elastic projection to a list of x/y points
+    :param points: the projected points to invert (km)
+    :param projection: the sections that comprise the projection
+    :param boundary: the map’s full projected outer shape (km)
+    :return: the latitude and longitude of each point (deg), which will be NaN for
+             points outside of the projected boundary, and a bool array indicating which
+             points are inside it
+    """
+    inverse = _inverse_projections.get_or_build(
+        projection, lambda: InverseProjection(projection, boundary)
+    )
+    return inverse(points)
+
+
+class CompactPoints:
+    def __init__(self, **fields: NDArray[np.floating]):
+        """a set of points stored as one contiguous array per coordinate (latitude and
+        longitude, or x and y), rather than as interleaved records.  reading a field is
+        then a plain contiguous read, and in float32 the points take half as much
+        memory.  project_points, project, rotate_points, and
+        cut_lines_that_cross_interruptions all accept these in place of XYPoint or
+        ΦΛPoint arrays, and give them back in kind.
+
+        the arrays are used as given, without copying, and slicing gives views.  the
+        arithmetic is still done in float64, so the only loss of precision is rounding
+        the inputs and outputs to float32: half a unit in the last place is at most
+        180/2^24 ≈ 1.1e-5° (about 1.2 m on the ground) in the latitudes and longitudes,
+        and 2^-10 km (about 1 m) for x and y values under 16,000 km (2 m past that).  in
+        practice the projected points are within 4 m of the float64 results, which is
+        about a thousandth of a pixel on a 2000 pixel wide map.  at the borders between
+        sections, a rounded latitude or longitude can land on the other side of the
+        border, in which case it gets projected by the neighboring section.
+        :param fields: the array of each coordinate, all of the same shape
+        """
+        shapes = {np.shape(array) for array in fields.values()}
+        if len(shapes) != 1:
+            raise ValueError(
+                f"the coordinate arrays don’t all have the same shape: {shapes}"
+            )
+        self.fields = fields
+
+    @staticmethod
+    def empty(
+        shape: int | tuple[int, ...], names: Iterable[str], dtype=np.float32
+    ) -> "CompactPoints":
+        """allocate a set of points without initializing them"""
+        return CompactPoints(**{name: np.empty(shape, dtype=dtype) for name in names})
+
+    @staticmethod
+    def from_records(records: NDArray[Any], dtype=np.float32) -> "CompactPoints":
+        """convert an array of XYPoint or ΦΛPoint records to separate arrays
+        :param dtype: the type of each array, or None to make strided views into the
+                      records rather than copying them
+        """
+        if dtype is None:
+            return CompactPoints(
+                **{name: records[name] for name in records.dtype.names}
+            )
+        else:
+            return CompactPoints(
+                **{
+                    name: np.ascontiguousarray(records[name], dtype=dtype)
+                    for name in records.dtype.names
+                }
+            )
+
+    def to_records(self) -> NDArray[Any]:
+        """convert these to an array of float64 records (XYPoint or ΦΛPoint)"""
+        records = np.empty(self.shape, dtype=[(name, float) for name in self.fields])
+        for name, array in self.fields.items():
+            records[name] = array
+        return records
+
+    def empty_like(self) -> "CompactPoints":
+        return CompactPoints.empty(self.shape, self.fields, self.dtype)
+
+    def copy(self) -> "CompactPoints":
+        return CompactPoints(
+            **{name: array.copy() for name, array in self.fields.items()}
+        )
+
+    def ravel(self) -> "CompactPoints":
+        return CompactPoints(
+            **{name: array.ravel() for name, array in self.fields.items()}
+        )
+
+    @property
+    def dtype(self) -> np.dtype:
+        """the type of the coordinates (not of the points, which don’t have one)"""
+        return next(iter(self.fields.values())).dtype
+
+    @property
+    def shape(self) -> tuple[int, ...]:
+        return np.shape(next(iter(self.fields.values())))
+
+    @property
+    def size(self) -> int:
+        return int(np.prod(self.shape))
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        """get a coordinate array by name, or some of the points by index"""
+        if isinstance(key, str):
+            return self.fields[key]
+        return CompactPoints(
+            **{name: array[key] for name, array in self.fields.items()}
+        )
+
+    def __setitem__(self, key, value) -> None:
+        """set a coordinate array by name, or some of the points by index from records,
+        other CompactPoints, or a tuple of one value for each coordinate
+        """
+        if isinstance(key, str):
+            self.fields[key][...] = value
+        elif isinstance(value, tuple):
+            for array, coordinate in zip(self.fields.values(), value):
+                array[key] = coordinate
+        else:
+            for name, array in self.fields.items():
+                array[key] = value[name]
+
+
+def empty_points_like(
+    points: NDArray[Any] | CompactPoints, dtype: np.dtype
+) -> NDArray[Any] | CompactPoints:
+    """allocate a flat array of points with the given record type, as CompactPoints if
+    the given points are CompactPoints (with the same precision) and as records
+    otherwise
+    """
+    if isinstance(points, CompactPoints):
+        return CompactPoints.empty(points.size, dtype.names, points.dtype)
+    else:
+        return np.empty(points.size, dtype=dtype)
+
+
+class PackedFeatures:
+    def __init__(
+        self,
+        points: NDArray[Any],
+        line_offsets: NDArray[int],
+        feature_offsets: NDArray[int],
+        categories: NDArray[int],
+        widths: NDArray[float],
+        crosses_interruption: Optional[NDArray[bool]] = None,
+    ):
+        """a set of features packed into a few flat arrays, so that they can be
+        projected and cut all at once rather than one line at a time
+        :param points: every point of every line, one line after another (deg or km)
+        :param line_offsets: the index of the first point of each line, followed by the
+                             total number of points
+        :param feature_offsets: the index of the first line of each feature, followed by
+                                the total number of lines
+        :param categories: the category of each feature
+        :param widths: the width of each feature
+        :param crosses_interruption: whether each point is across an interruption from
+                                     the one before it in the same line (or from the
+                                     last point, for the first point), if known.
+                                     project fills this in.
+        """
+        self.points = points
+        self.line_offsets = line_offsets
+        self.feature_offsets = feature_offsets
+        self.categories = categories
+        self.widths = widths
+        self.crosses_interruption = crosses_interruption
+
+    @staticmethod
+    def pack(
+        features: list[ΦΛFeature] | list[XYFeature], dtype: np.dtype = ΦΛPoint
+    ) -> "PackedFeatures":
+        """copy a list of features into a single set of flat arrays
+        :param features: the features to pack
+        :param dtype: the type of the points, in case there aren’t any
+        """
+        lines = [
+            line
+            for category, width, feature_lines in features
+            for line in feature_lines
+        ]
+        line_lengths = [line.size for line in lines]
+        feature_lengths = [
+            len(feature_lines) for category, width, feature_lines in features
+        ]
+        return PackedFeatures(
+            np.concatenate(lines) if len(lines) > 0 else np.empty(0, dtype=dtype),
+            np.concatenate([[0], np.cumsum(line_lengths, dtype=int)]),
+            np.concatenate([[0], np.cumsum(feature_lengths, dtype=int)]),
+            np.array(
+                [category for category, width, feature_lines in features], dtype=int
+            ),
+            np.array(
+                [width for category, width, feature_lines in features], dtype=float
+            ),
+        )
+
+    def unpack(self) -> list[ΦΛFeature] | list[XYFeature]:
+        """convert this to a list of features whose lines are views into the points"""
+        return list(self)
+
+    def with_points(self, points: NDArray[Any]) -> "PackedFeatures":
+        """make a new set of features with this one’s layout but different points"""
+        assert points.size == self.points.size
+        return PackedFeatures(
+            points,
+            self.line_offsets,
+            self.feature_offsets,
+            self.categories,
+            self.widths,
+            self.crosses_interruption,
+        )
+
+    def get_previous_indices(self, wrap: bool) -> NDArray[int]:
+        """get the index of the point before each point in the same line
+        :param wrap: whether the first point of each line should point to the last one;
+                     if not, it points to the last point of the previous line (or -1)
+        """
+        previous = np.arange(-1, self.points.size - 1)
+        if wrap:
+            line_starts = self.line_offsets[:-1]
+            line_ends = self.line_offsets[1:]
+            nonempty = line_ends > line_starts
+            previous[line_starts[nonempty]] = line_ends[nonempty] - 1
+        return previous
+
+    def get_envelopes(self, by_line: bool = False) -> tuple[NDArray[Any], NDArray[Any]]:
+        """find the smallest box that contains each feature (or each line)
+        :param by_line: whether to get one box per line rather than one per feature
+        :return: the lower and upper corners of each box, with the same fields as the
+                 points.  empty features get NaN boxes, which don’t overlap anything.
+        """
+        offsets = self.line_offsets
+        if not by_line:
+            offsets = self.line_offsets[self.feature_offsets]
+        starts, ends = offsets[:-1], offsets[1:]
+        nonempty = ends > starts
+        lower = np.full(starts.size, nan, dtype=self.points.dtype)
+        upper = np.full(starts.size, nan, dtype=self.points.dtype)
+        if np.any(nonempty):
+            # the nonempty ones are contiguous, so each one runs right up to the start
+            # of the next
+            for name in self.points.dtype.names:
+                lower[name][nonempty] = np.minimum.reduceat(
+                    self.points[name], starts[nonempty]
+                )
+                upper[name][nonempty] = np.maximum.reduceat(
+                    self.points[name], starts[nonempty]
+                )
+        return lower, upper
+
+    def subset(
+        self, feature_indices: NDArray[int], line_mask: Optional[NDArray[bool]] = None
+    ) -> "PackedFeatures":
+        """make a new set of features containing only some of these features
+        :param feature_indices: the indices of the features to keep, in order
+        :param line_mask: which lines to keep (among all the lines of all the features),
+                          if not every line of the features being kept
+        """
+        feature_indices = np.asarray(feature_indices, dtype=int)
+        line_starts = self.feature_offsets[feature_indices]
+        line_ends = self.feature_offsets[feature_indices + 1]
+        line_counts = line_ends - line_starts
+        line_indices = np.concatenate(
+            [np.arange(start, end) for start, end in zip(line_starts, line_ends)]
+            + [np.empty(0, dtype=int)]
+        )
+        if line_mask is not None:
+            kept = line_mask[line_indices]
+            feature_of_line = np.repeat(np.arange(feature_indices.size), line_counts)
+            line_counts = np.bincount(
+                feature_of_line[kept], minlength=feature_indices.size
+            )
+            line_indices = line_indices[kept]
+        point_starts = self.line_offsets[line_indices]
+        point_ends = self.line_offsets[line_indices + 1]
+        point_indices = np.concatenate(
+            [np.arange(start, end) for start, end in zip(point_starts, point_ends)]
+            + [np.empty(0, dtype=int)]
+        )
+        return PackedFeatures(
+            self.points[point_indices],
+            np.concatenate([[0], np.cumsum(point_ends - point_starts)]).astype(int),
+            np.concatenate([[0], np.cumsum(line_counts)]).astype(int),
+            self.categories[feature_indices],
+            self.widths[feature_indices],
+            (
+                self.crosses_interruption[point_indices]
+                if self.crosses_interruption is not None
+                else None
+            ),
+        )
+
+    def line(self, index: int) -> NDArray[Any]:
+        """get one line by its index among all the lines of all the features"""
+        return self.points[self.line_offsets[index] : self.line_offsets[index + 1]]
+
+    def __len__(self) -> int:
+        return self.categories.size
+
+    def __iter__(self):
+        for i in range(len(self)):
+            lines = [
+                self.line(k)
+                for k in range(self.feature_offsets[i], self.feature_offsets[i + 1])
+            ]
+            yield int(self.categories[i]), float(self.widths[i]), lines
+
+
 def is_counterclockwise(path: Path) -> bool:
     """determines whether the polygon is oriented in the normal direction"""
-    area = 0
-    for i in range(len(path)):
-        area += (
-            path.vertices[i - 1, 1] * path.vertices[i, 0]
-            - path.vertices[i - 1, 0] * path.vertices[i, 1]
-        )
-    return area > 0
+    vertices = path.vertices
+    previous = np.roll(vertices, 1, axis=0)
+    area = np.sum(previous[:, 1] * vertices[:, 0] - previous[:, 0] * vertices[:, 1])
+    return bool(area > 0)
+
+
+_loaded_projections = (
+    SectionCache()
+)  # keyed by the path, modification time, and size alone
+_transformed_projections = (
+    SectionCache()
+)  # keyed by the original sections and the transform
+_transformed_sections = (
+    SectionCache()
+)  # keyed by the original sections and the transform
 
 
 def load_elastic_projection(
     path: FilePath | str,
+    rotation_deg: float = 0,
+    scale: float = 1,
+    offset: tuple[float, float] = (0, 0),
 ) -> tuple[list[Section], XYLine, float]:
-    """load the hdf5 file that defines an elastic projection
+    """load the hdf5 file that defines an elastic projection.  if it has already been
+    loaded and hasn’t changed since, you get the same sections as last time.  if there’s
+    an up-to-date compiled version next to it (see compile_elastic_projection), that
+    gets loaded instead.
     :param name: one of "elastic-I", "elastic-II", or "elastic-III"
-    :return: the list of sections that comprise this projection, and the map’s full projected outer shape
+    :param rotation_deg: the angle by which to rotate the map (deg).  this, the scale,
+                         and the offset are applied to the projected points in memory,
+                         once, and the transformed projection is cached with the
+                         original.
+    :param scale: the factor by which to scale the map, after rotating it
+    :param offset: the amount by which to shift the map, after rotating and scaling it
+                   (km)
+    :return: the list of sections that comprise this projection, and the map’s full
+             projected outer shape
     """
-    path = FilePath(path)
+    if rotation_deg != 0 or scale != 1 or tuple(offset) != (0, 0):
+        transform = (
+            float(rotation_deg),
+            float(scale),
+            float(offset[0]),
+            float(offset[1]),
+        )
+        sections, boundary, aspect_ratio = load_elastic_projection(path)
+
+        def transform_projection():
+            x_min, x_max, y_min, y_max = transform_bounding_box(
+                load_bounding_box(path), boundary, *transform
+            )
+            return (
+                transform_sections(sections, *transform),
+                transform_points(boundary, *transform),
+                (x_max - x_min) / (y_max - y_min),
+            )
+
+        return _transformed_projections.get_or_build(
+            sections, transform_projection, transform
+        )
+
+    with stage("load_elastic_projection"):
+        path = FilePath(path).resolve()
+        compiled_path = get_compiled_projection_path(path)
+        use_compiled = path.suffix == COMPILED_SUFFIX or (
+            compiled_path.is_file()
+            and compiled_path.stat().st_mtime_ns >= path.stat().st_mtime_ns
+        )
+        if use_compiled and path.suffix != COMPILED_SUFFIX:
+            path = compiled_path
+        key = (str(path), path.stat().st_mtime_ns, path.stat().st_size)
+
+        def load_projection():
+            log(f"loading {path}")
+            if use_compiled:
+                return load_compiled_projection(path)
+            else:
+                return load_hdf5_projection(path)
+
+        return _loaded_projections.get_or_build((), load_projection, *key)
+
+
+def transform_points(
+    points: NDArray[XYPoint],
+    rotation_deg: float,
+    scale: float = 1,
+    x_offset: float = 0,
+    y_offset: float = 0,
+) -> NDArray[XYPoint]:
+    """rotate some projected points, then scale them, then shift them"""
+    transformed = (
+        rotate_points(points, rotation_deg) if rotation_deg != 0 else points.copy()
+    )
+    if scale != 1:
+        transformed["x"] *= scale
+        transformed["y"] *= scale
+    transformed["x"] += x_offset
+    transformed["y"] += y_offset
+    return transformed
+
+
+def transform_sections(
+    sections: list[Section],
+    rotation_deg: float,
+    scale: float = 1,
+    x_offset: float = 0,
+    y_offset: float = 0,
+) -> list[Section]:
+    """derive a rotated, scaled, and shifted copy of a projection, transforming each
+    Section’s grid of projected points once.  the geographic side of each Section is
+    shared with the original, and so is the SectionIndex.  you get the same copy each
+    time you ask for the same transform of the same sections.
+    """
+    transform = (rotation_deg, scale, x_offset, y_offset)
+
+    def build_transformed_sections():
+        transformed = [
+            Section(
+                section.ф_nodes,
+                section.λ_nodes,
+                transform_points(section.xy_nodes, *transform),
+                section.border_points,
+                section.border_is_counterclockwise,
+            )
+            for section in sections
+        ]
+        # which section owns each point doesn’t change, so the index can be shared
+        index = get_section_index(sections)
+        _section_indices.put(
+            transformed,
+            SectionIndex(transformed, index.resolution, owners=index.owners),
+        )
+        return transformed
+
+    return _transformed_sections.get_or_build(
+        sections, build_transformed_sections, transform
+    )
+
+
+def transform_bounding_box(
+    bounding_box: tuple[float, float, float, float],
+    boundary: XYLine,
+    rotation_deg: float,
+    scale: float = 1,
+    x_offset: float = 0,
+    y_offset: float = 0,
+) -> tuple[float, float, float, float]:
+    """work out the bounding box of a transformed map.  if it’s rotated, it gets
+    recalculated from the projected boundary (like copy_rotated_projection does);
+    otherwise the corners just move.
+    :return: the left, right, bottom, and top edges of the transformed map (km)
+    """
+    if rotation_deg != 0:
+        boundary = transform_points(boundary, rotation_deg, scale, x_offset, y_offset)
+        return (
+            float(np.nanmin(boundary["x"])),
+            float(np.nanmax(boundary["x"])),
+            float(np.nanmin(boundary["y"])),
+            float(np.nanmax(boundary["y"])),
+        )
+    x_min, x_max, y_min, y_max = bounding_box
+    return (
+        x_min * scale + x_offset,
+        x_max * scale + x_offset,
+        y_min * scale + y_offset,
+        y_max * scale + y_offset,
+    )
+
+
+def load_hdf5_projection(path: FilePath) -> tuple[list[Section], XYLine, float]:
+    """load the hdf5 file that defines an elastic projection, without any caching"""
     with h5py.File(path, "r") as file:
         sections = []
         for h in range(file.attrs["number of sections"]):
@@ -106,44 +1185,449 @@ def load_elastic_projection(
     return sections, boundary, aspect_ratio
 
 
-def load_geographic_data(filename: str) -> tuple[list[ΦΛFeature], bool]:
+def load_bounding_box(
+    path: FilePath | str,
+    rotation_deg: float = 0,
+    scale: float = 1,
+    offset: tuple[float, float] = (0, 0),
+) -> tuple[float, float, float, float]:
+    """read the rectangle that just contains the projected map out of an elastic
+    projection’s hdf5 file (or out of the header of its compiled version)
+    :param rotation_deg: the angle by which the map is rotated (deg); see
+                         load_elastic_projection
+    :param scale: the factor by which the map is scaled
+    :param offset: the amount by which the map is shifted (km)
+    :return: the left, right, bottom, and top edges of the map (km)
+    """
+    if FilePath(path).suffix == COMPILED_SUFFIX:
+        header, _ = load_compiled_header(path)
+        if "bounding box" not in header:
+            raise ValueError(
+                f"{path} was compiled by an older version; please recompile it"
+            )
+        bounding_box = tuple(header["bounding box"])
+    else:
+        with h5py.File(path, "r") as file:
+            bounding_box = file["bounding box"][:]
+        bounding_box = (
+            float(bounding_box["x"][0]),
+            float(bounding_box["x"][1]),
+            float(bounding_box["y"][0]),
+            float(bounding_box["y"][1]),
+        )
+    if rotation_deg != 0 or scale != 1 or tuple(offset) != (0, 0):
+        _, boundary, _ = load_elastic_projection(path)
+        bounding_box = transform_bounding_box(
+            bounding_box, boundary, rotation_deg, scale, offset[0], offset[1]
+        )
+    return bounding_box
+
+
+def get_viewport_region(
+    viewport: dict[str, tuple[float, float]], sections: list[Section], boundary: XYLine
+) -> tuple[tuple[float, float, float, float], tuple[float, float, float, float]]:
+    """work out what a viewport shows, both on the projected plane and on the globe
+    :param viewport: either a box on the globe, as dict(latitude=(south, north),
+                     longitude=(west, east)) (deg), or a box on the projected plane, as
+                     dict(x=(left, right), y=(bottom, top)) (km)
+    :param sections: the sections of the projection, transformed the way they’ll be
+                     drawn
+    :param boundary: the map’s projected outer shape, transformed the same way (km)
+    :return: the left, right, bottom, and top edges of the viewport on the projected
+             plane (km); and the south, north, west, and east edges of a box on the
+             globe that contains everything that shows up in it (deg)
+    """
+    if "latitude" in viewport and "longitude" in viewport:
+        # project a grid over the box to see where it lands.  if the box spans an
+        # interruption, its pieces land in different places, so go with the piece in the
+        # same section as its center.
+        grid = np.empty((VIEWPORT_SAMPLES, VIEWPORT_SAMPLES), dtype=ΦΛPoint)
+        grid["latitude"] = np.linspace(*viewport["latitude"], VIEWPORT_SAMPLES)[
+            :, newaxis
+        ]
+        grid["longitude"] = np.linspace(*viewport["longitude"], VIEWPORT_SAMPLES)[
+            newaxis, :
+        ]
+        grid = grid.ravel()
+        owners = get_section_index(sections).locate(grid)
+        center = np.array(
+            [(np.mean(viewport["latitude"]), np.mean(viewport["longitude"]))],
+            dtype=ΦΛPoint,
+        )
+        grid = grid[owners == get_section_index(sections).locate(center)[0]]
+        xy = project_points(grid, sections)
+        extent = (
+            float(np.min(xy["x"])),
+            float(np.max(xy["x"])),
+            float(np.min(xy["y"])),
+            float(np.max(xy["y"])),
+        )
+    elif "x" in viewport and "y" in viewport:
+        extent = (
+            float(viewport["x"][0]),
+            float(viewport["x"][1]),
+            float(viewport["y"][0]),
+            float(viewport["y"][1]),
+        )
+    else:
+        raise ValueError(
+            f"a viewport needs either latitude and longitude or x and y, not "
+            f"{', '.join(viewport)}"
+        )
+    x_min, x_max, y_min, y_max = extent
+    if not (x_min < x_max and y_min < y_max):
+        raise ValueError(f"this viewport is empty: {viewport}")
+
+    # then invert a grid over the rectangle that shows, since it may take in more than
+    # was asked for
+    grid = np.empty((VIEWPORT_SAMPLES, VIEWPORT_SAMPLES), dtype=XYPoint)
+    grid["x"] = np.linspace(x_min, x_max, VIEWPORT_SAMPLES)[newaxis, :]
+    grid["y"] = np.linspace(y_min, y_max, VIEWPORT_SAMPLES)[:, newaxis]
+    latlon, inside = inverse_project_points(grid.ravel(), sections, boundary)
+    if not np.any(inside):
+        raise ValueError(f"this viewport doesn’t contain any of the map: {viewport}")
+    ф, λ = latlon["latitude"][inside], latlon["longitude"][inside]
+    region = (
+        max(-90.0, float(np.min(ф)) - VIEWPORT_MARGIN),
+        min(90.0, float(np.max(ф)) + VIEWPORT_MARGIN),
+        max(-180.0, float(np.min(λ)) - VIEWPORT_MARGIN),
+        min(180.0, float(np.max(λ)) + VIEWPORT_MARGIN),
+    )
+    return extent, region
+
+
+_culled_sections = (
+    SectionCache()
+)  # keyed by the original sections and which ones are kept
+
+
+def cull_sections(
+    sections: list[Section], region: tuple[float, float, float, float]
+) -> list[Section]:
+    """leave out the Sections whose borders don’t touch a box on the globe.  the
+    remaining sections share the original SectionIndex’s lookup grid, and you get the
+    same list each time you cull the same sections down to the same ones.
+    :param sections: the sections of the projection
+    :param region: the south, north, west, and east edges of the box (deg)
+    :return: the sections that might contain some part of the box, in their original
+             order
+    """
+    ф_min, ф_max, λ_min, λ_max = region
+    box = Bbox(
+        [[ф_min, λ_min], [ф_max, λ_max]]
+    )  # the borders are in latitude, longitude order
+    corners = np.array([[ф_min, λ_min], [ф_min, λ_max], [ф_max, λ_min], [ф_max, λ_max]])
+    kept = []
+    for h, section in enumerate(sections):
+        if section.border_is_counterclockwise:
+            touches = section.border.intersects_bbox(box, filled=True)
+        else:  # a clockwise border encloses everything outside it
+            touches = section.border.intersects_bbox(box, filled=False) or not np.all(
+                section.border.contains_points(corners)
+            )
+        if touches:
+            kept.append(h)
+    if len(kept) == len(sections):
+        return sections
+    kept = tuple(kept)
+
+    def build_culled_sections():
+        culled = [sections[h] for h in kept]
+        # renumber the owners in the lookup grid rather than building a new one
+        index = get_section_index(sections)
+        renumbering = np.full(len(sections), SectionIndex.NO_SECTION, dtype=np.int8)
+        renumbering[list(kept)] = np.arange(len(kept))
+        owners = np.where(
+            index.owners >= 0, renumbering[np.maximum(index.owners, 0)], index.owners
+        )
+        _section_indices.put(
+            culled,
+            SectionIndex(culled, index.resolution, owners=owners.astype(np.int8)),
+        )
+        return culled
+
+    return _culled_sections.get_or_build(sections, build_culled_sections, kept)
+
+
+def get_compiled_projection_path(path: FilePath | str) -> FilePath:
+    """find where the compiled version of an hdf5 projection file goes"""
+    return FilePath(path).with_suffix(COMPILED_SUFFIX)
+
+
+def compile_elastic_projection(
+    path: FilePath | str, output_path: Optional[FilePath | str] = None
+) -> FilePath:
+    """convert the hdf5 file that defines an elastic projection into a single
+    memory-mappable file that also contains each border’s orientation and the
+    SectionIndex lookup grid, so that loading it takes almost no time.  the file is a
+    magic number, the length of a JSON header, the JSON header (which says where each
+    array is), and then the raw arrays.
+    :param path: the hdf5 file
+    :param output_path: where to save the compiled file (by default, next to the hdf5
+                        file)
+    :return: the path of the compiled file
+    """
+    path = FilePath(path)
+    output_path = (
+        FilePath(output_path)
+        if output_path is not None
+        else get_compiled_projection_path(path)
+    )
+    sections, boundary, aspect_ratio = load_hdf5_projection(path)
+    index = SectionIndex(sections)
+    arrays = {"projected boundary": boundary, "owners": index.owners}
+    for h, section in enumerate(sections):
+        arrays[f"section {h}/latitude"] = section.ф_nodes
+        arrays[f"section {h}/longitude"] = section.λ_nodes
+        arrays[f"section {h}/projected points"] = section.xy_nodes
+        arrays[f"section {h}/boundary"] = section.border_points
+    layout = []
+    size = 0
+    for name, array in arrays.items():
+        size = ceil(size / 64) * 64  # keep everything aligned
+        layout.append(
+            [name, size, list(array.shape), np.lib.format.dtype_to_descr(array.dtype)]
+        )
+        size += array.nbytes
+    header = json.dumps(
+        {
+            "number of sections": len(sections),
+            "aspect ratio": aspect_ratio,
+            "bounding box": load_bounding_box(path),
+            "border is counterclockwise": [
+                section.border_is_counterclockwise for section in sections
+            ],
+            "index resolution": index.resolution,
+            "arrays": layout,
+        }
+    ).encode()
+    data_start = ceil((len(COMPILED_MAGIC) + 8 + len(header)) / 64) * 64
+    with open(output_path, "wb") as file:
+        file.write(COMPILED_MAGIC)
+        file.write(len(header).to_bytes(8, "little"))
+        file.write(header)
+        for name, offset, shape, descr in layout:
+            file.write(b"\0" * (data_start + offset - file.tell()))
+            file.write(np.ascontiguousarray(arrays[name]).tobytes())
+    return output_path
+
+
+def load_compiled_header(path: FilePath | str) -> tuple[dict, int]:
+    """read just the JSON header of a file made by compile_elastic_projection
+    :return: the header, and the offset in the file at which the arrays start
+    """
+    with open(path, "rb") as file:
+        if file.read(len(COMPILED_MAGIC)) != COMPILED_MAGIC:
+            raise ValueError(f"{path} is not a compiled Elastic projection")
+        header_length = int.from_bytes(file.read(8), "little")
+        header = json.loads(file.read(header_length))
+    data_start = ceil((len(COMPILED_MAGIC) + 8 + header_length) / 64) * 64
+    return header, data_start
+
+
+def load_compiled_projection(path: FilePath) -> tuple[list[Section], XYLine, float]:
+    """load a file made by compile_elastic_projection, without any caching.  the arrays
+    are memory-mapped, so a section’s grid isn’t actually read until something uses it.
+    """
+    header, data_start = load_compiled_header(path)
+    contents = np.memmap(path, dtype=np.uint8, mode="r")
+    arrays = {}
+    for name, offset, shape, descr in header["arrays"]:
+        dtype = np.lib.format.descr_to_dtype(descr)
+        start = data_start + offset
+        size = int(np.prod(shape)) * dtype.itemsize
+        arrays[name] = contents[start : start + size].view(dtype).reshape(shape)
+    sections = [
+        Section(
+            arrays[f"section {h}/latitude"],
+            arrays[f"section {h}/longitude"],
+            arrays[f"section {h}/projected points"],
+            arrays[f"section {h}/boundary"],
+            header["border is counterclockwise"][h],
+        )
+        for h in range(header["number of sections"])
+    ]
+    # register the precomputed lookup grid so that get_section_index doesn’t rebuild it
+    _section_indices.put(
+        sections,
+        SectionIndex(sections, header["index resolution"], owners=arrays["owners"]),
+    )
+    return sections, arrays["projected boundary"], header["aspect ratio"]
+
+
+def load_geographic_data(filename: str | FilePath) -> tuple[list[ΦΛFeature], bool]:
     """load a bunch of polylines from a shapefile
-    :param filename: the name of the shapefile zip file
-    :return: a list of features, each comprising a "category" (the biome if available, the index
-             otherwise), a "width" (only available from Natural Earth’s "rivers with scale
-             ranks" dataset), and a list of series of geographic coordinates (degrees);
-             and a bool indicating whether this is a closed polygon rather than an open polyline
+    :param filename: the name of a Natural Earth shapefile zip file, or the path to any
+                     shapefile (either a .zip or a .shp)
+    :return: a list of features, each comprising a "category" (the biome if available,
+             the index otherwise), a "width" (only available from Natural Earth’s
+             "rivers with scale ranks" dataset), and a list of series of geographic
+             coordinates (degrees); and a bool indicating whether this is a closed
+             polygon rather than an open polyline
     """
-    encoding = "latin-1" if "wwf_" in filename else "utf-8"
-    features: list[ΦΛFeature] = []
-    closed = True
-    # TODO: make take paths
-    path = root_dir / f"resources/shapefiles/natural_earth/{filename}.zip"
-    with shapefile.Reader(path, encoding=encoding) as f:
-        for index, (record, shape) in enumerate(zip(f.records(), f.shapes())):
-            closed = shape.shapeTypeName == "POLYGON"
-            try:
-                category = min(15, int(record["BIOME"])) - 1
-            except IndexError:
-                category = index
-            try:
-                width = 0.5 * record["strokeweig"]  # SIC
-            except IndexError:
-                width = 1
-            lines: list[XYLine] = []
-            for i in range(len(shape.parts)):
-                start = shape.parts[i]
-                end = (
-                    shape.parts[i + 1]
-                    if i + 1 < len(shape.parts)
-                    else len(shape.points)
-                )
-                line = np.empty(end - start, dtype=ΦΛPoint)
-                for j, (λ, ф) in enumerate(shape.points[start:end]):
-                    line[j] = (max(-90, min(90, ф)), max(-180, min(180, λ)))
-                lines.append(line)
-            features.append((category, width, lines))
-    return features, closed
+    features, closed = load_packed_geographic_data(filename)
+    return features.unpack(), closed
+
+
+def load_packed_geographic_data(
+    filename: str | FilePath,
+) -> tuple[PackedFeatures, bool]:
+    """load a bunch of polylines from a shapefile, reading the geometry straight into a
+    flat array rather than going thru pyshp’s shape objects
+    :param filename: the name of a Natural Earth shapefile zip file, or the path to any
+                     shapefile (either a .zip or a .shp)
+    :return: the features, packed, and a bool indicating whether this is a closed
+             polygon rather than an open polyline
+    """
+    path = get_shapefile_path(filename)
+    encoding = "latin-1" if "wwf_" in str(filename) else "utf-8"
+    files = read_shapefile_files(path)
+    points, line_offsets, feature_offsets, shape_types = parse_shp(
+        files["shp"], files.get("shx")
+    )
+    closed = shape_types.size == 0 or shape_types[-1] == shapefile.POLYGON
+
+    with shapefile.Reader(dbf=files["dbf"], encoding=encoding) as f:
+        field_names = [field[0] for field in f.fields[1:]]
+        fields = [name for name in ["BIOME", "strokeweig"] if name in field_names]
+        records = list(f.iterRecords(fields=fields)) if len(fields) > 0 else []
+    categories = np.arange(shape_types.size)
+    widths = np.ones(shape_types.size)
+    if "BIOME" in fields:
+        categories = np.array(
+            [min(15, int(record["BIOME"])) - 1 for record in records], dtype=int
+        )
+    if "strokeweig" in fields:
+        widths = np.array(
+            [0.5 * record["strokeweig"] for record in records], dtype=float
+        )  # SIC
+
+    return (
+        PackedFeatures(points, line_offsets, feature_offsets, categories, widths),
+        closed,
+    )
+
+
+def get_shapefile_path(filename: str | FilePath) -> FilePath:
+    """find a shapefile, given either the name of a Natural Earth dataset or a path"""
+    if isinstance(filename, FilePath) or FilePath(filename).suffix.lower() in [
+        ".zip",
+        ".shp",
+    ]:
+        return FilePath(filename)
+    else:
+        return root_dir / f"resources/shapefiles/natural_earth/{filename}.zip"
+
+
+def read_shapefile_files(path: FilePath) -> dict[str, Any]:
+    """get the contents of the .shp, .shx, and .dbf files that make up a shapefile
+    :param path: either a zip file containing a shapefile or the .shp file itself
+    :return: the .shp and .shx files as uint8 arrays (the .shx may be missing), and the
+             .dbf file as a file-like object
+    """
+    files: dict[str, Any] = {}
+    if path.suffix.lower() == ".zip":
+        with zipfile.ZipFile(path) as archive:
+            for name in archive.namelist():
+                extension = name.rsplit(".", 1)[-1].lower()
+                if extension in ["shp", "shx", "dbf"] and extension not in files:
+                    files[extension] = archive.read(name)
+        for extension in ["shp", "shx"]:
+            if extension in files:
+                files[extension] = np.frombuffer(files[extension], dtype=np.uint8)
+        if "dbf" in files:
+            files["dbf"] = io.BytesIO(files["dbf"])
+    else:
+        for extension in ["shp", "shx"]:
+            sibling = path.with_suffix(f".{extension}")
+            if sibling.is_file():
+                files[extension] = np.memmap(sibling, dtype=np.uint8, mode="r")
+        if path.with_suffix(".dbf").is_file():
+            files["dbf"] = io.BytesIO(path.with_suffix(".dbf").read_bytes())
+    if "shp" not in files or "dbf" not in files:
+        raise FileNotFoundError(f"{path} is missing its .shp or .dbf file")
+    return files
+
+
+def parse_shp(
+    shp: NDArray[np.uint8], shx: Optional[NDArray[np.uint8]] = None
+) -> tuple[NDArray[ΦΛPoint], NDArray[int], NDArray[int], NDArray[int]]:
+    """read the geometry out of a .shp file in bulk.  only polylines and polygons (with
+    or without Z and M) have any lines; every other shape is treated as having no parts.
+    :param shp: the contents of the .shp file
+    :param shx: the contents of the .shx file, which lets us find the records without
+                walking thru the file
+    :return: the points, clamped to the valid latitudes and longitudes (deg); the index
+             of the first point of each line, followed by the total number of points;
+             the index of the first line of each record, followed by the total number of
+             lines; and each record’s shape type
+    """
+    # find where each record’s content starts
+    if shx is not None:
+        record_offsets = (
+            2 * np.frombuffer(shx, dtype=">i4", offset=100).reshape((-1, 2))[:, 0]
+        )
+    else:
+        record_offsets = []
+        position = 100
+        while position + 8 <= shp.size:
+            record_offsets.append(position)
+            position += 8 + 2 * int(
+                np.frombuffer(shp, dtype=">i4", count=1, offset=position + 4)[0]
+            )
+        record_offsets = np.array(record_offsets, dtype=int)
+    content_offsets = record_offsets.astype(int) + 8
+
+    def read_ints(offsets: NDArray[int]) -> NDArray[int]:
+        return (
+            shp[offsets[:, newaxis] + np.arange(4)].copy().view("<i4")[:, 0].astype(int)
+        )
+
+    shape_types = read_ints(content_offsets)
+    has_parts = np.isin(
+        shape_types,
+        [
+            shapefile.POLYLINE,
+            shapefile.POLYGON,
+            shapefile.POLYLINEZ,
+            shapefile.POLYGONZ,
+            shapefile.POLYLINEM,
+            shapefile.POLYGONM,
+        ],
+    )
+    num_parts = np.where(
+        has_parts, read_ints(np.where(has_parts, content_offsets + 36, 0)), 0
+    )
+    num_points = np.where(
+        has_parts, read_ints(np.where(has_parts, content_offsets + 40, 0)), 0
+    )
+
+    # then grab each record’s parts and points as whole blocks
+    parts = []
+    coordinates = []
+    for i in np.nonzero(has_parts)[0]:
+        parts_offset = content_offsets[i] + 44
+        points_offset = parts_offset + 4 * num_parts[i]
+        parts.append(
+            np.frombuffer(shp, dtype="<i4", count=num_parts[i], offset=parts_offset)
+        )
+        coordinates.append(
+            np.frombuffer(
+                shp, dtype="<f8", count=2 * num_points[i], offset=points_offset
+            )
+        )
+    point_offsets = np.cumsum(num_points) - num_points
+    line_starts = np.concatenate(
+        [offset + part for offset, part in zip(point_offsets[has_parts], parts)]
+        + [np.empty(0, dtype=int)]
+    )
+    coordinates = np.concatenate(coordinates + [np.empty(0)]).reshape((-1, 2))
+    points = np.empty(coordinates.shape[0], dtype=ΦΛPoint)
+    points["latitude"] = np.clip(coordinates[:, 1], -90, 90)
+    points["longitude"] = np.clip(coordinates[:, 0], -180, 180)
+    line_offsets = np.concatenate([line_starts, [points.size]]).astype(int)
+    feature_offsets = np.concatenate([[0], np.cumsum(num_parts)]).astype(int)
+    return points, line_offsets, feature_offsets, shape_types
 
 
 def rotate_points(v, degrees):
@@ -152,75 +1636,482 @@ def rotate_points(v, degrees):
     sin = np.sin(radians)
     x = cos * v["x"] + sin * v["y"]
     y = cos * v["y"] - sin * v["x"]
-    rotated = np.empty_like(v)
+    rotated = v.empty_like() if isinstance(v, CompactPoints) else np.empty_like(v)
     rotated["x"] = x
     rotated["y"] = y
     return rotated
 
 
-def project_points(points: list[ΦΛPoint], projection: list[Section]) -> list[XYPoint]:
-    """apply the given Elastic projection to a list of lat/lon points"""
-    projected_points: list[XYPoint] = np.empty(points.size, dtype=XYPoint)
-    for section in projection:
-        in_this_section = section.contains(points)
-        projected_points[in_this_section] = section.get_planar_coordinates(
-            points[in_this_section]
+class UnprojectablePointsError(ValueError):
+    def __init__(self, indices: NDArray[int]):
+        """an error raised when some points can’t be projected because no section
+        contains them
+        :param indices: the indices of the offending points in the input
+        """
+        self.indices = indices
+        super().__init__(
+            f"{indices.size} points could not be projected because they’re not in any "
+            f"section (the first is at index {indices[0]})"
         )
-    assert not np.any(np.isnan(projected_points["x"]))
-    return projected_points
 
+    def __reduce__(self):
+        # so that it can be raised in a worker process and passed back
+        return UnprojectablePointsError, (self.indices,)
 
-def project(features: list[ΦΛFeature], projection: list[Section]) -> list[XYFeature]:
-    """apply the given Elastic projection, defined by a list of sections, to the given series of
-    latitudes and longitudes.
+
+def project_points(
+    points: list[ΦΛPoint] | CompactPoints,
+    projection: list[Section],
+    first_index: int = 0,
+    processes: int = 1,
+    owners: Optional[NDArray[int]] = None,
+) -> list[XYPoint] | CompactPoints:
+    """apply the given Elastic projection to a list of lat/lon points
+    :param points: the points to project, either as records or as CompactPoints, in
+                   which case the result is CompactPoints of the same precision (and
+                   it’s always done serially)
+    :param first_index: the index of the first point in the full input, if this is one
+                        chunk of a larger array, so that any errors point to the right
+                        place
+    :param processes: the number of processes to spread the work across.  the result is
+                      the same either way, and it’s done serially if there are fewer
+                      than PARALLEL_THRESHOLD points.  the processes are started the
+                      first time and then kept for later calls with the same sections
+                      and number of processes.
+    :param owners: the index of the section that contains each point, if you already
+                   know it
     """
-    projected_features: list[XYFeature] = []
-    for j, (category, width, lines) in enumerate(features):
-        # print(f"projecting feature {j: 3d}/{len(features): 3d} ({sum(len(line) for line in lines)} points)")
-        projected_lines: list[XYLine] = []
-        for line in lines:
-            projected_line = np.empty(line.size, dtype=XYPoint)
-            projected_line[:] = (nan, nan)
-            # for each line, project it into whichever section that can accommodate it
-            for section in projection:
-                in_this_section = section.contains(line)
-                projected_line[in_this_section] = section.get_planar_coordinates(
-                    line[in_this_section]
+    if (
+        processes > 1
+        and points.size >= PARALLEL_THRESHOLD
+        and not isinstance(points, CompactPoints)
+    ):
+        projector = _parallel_projectors.get_or_build(
+            projection, lambda: ParallelProjector(projection, processes), processes
+        )
+        return projector.project_points(points, first_index=first_index)
+    projected_points: list[XYPoint] = empty_points_like(points, XYPoint)
+    projected_points[:] = (nan, nan)
+    if owners is None:
+        owners = get_section_index(projection).locate(points)
+    for h, section in enumerate(projection):
+        in_this_section = np.nonzero(owners == h)[0]
+        if in_this_section.size > 0:
+            projected_points[in_this_section] = section.get_planar_coordinates(
+                points[in_this_section]
+            )
+    unprojected = np.nonzero(np.isnan(projected_points["x"]))[0]
+    if unprojected.size > 0:
+        raise UnprojectablePointsError(first_index + unprojected)
+    return projected_points
+
+
+class ParallelProjector:
+    def __init__(self, projection: list[Section], processes: Optional[int] = None):
+        """a pool of processes that share one copy of a projection’s section grids,
+        borders, and SectionIndex, all of which live in shared memory rather than being
+        pickled to each worker.  it’s a context manager; close it (or leave the with
+        block) to stop the processes.
+        :param projection: the sections that comprise the projection
+        :param processes: the number of worker processes (by default, one per CPU)
+        """
+        self.processes = processes if processes is not None else os.cpu_count()
+        arrays = {"owners": get_section_index(projection).owners}
+        for h, section in enumerate(projection):
+            arrays[f"section {h}/latitude"] = section.ф_nodes
+            arrays[f"section {h}/longitude"] = section.λ_nodes
+            arrays[f"section {h}/projected points"] = section.xy_nodes
+            arrays[f"section {h}/boundary"] = section.border_points
+        self.memory, layout = share_arrays(arrays)
+        self.pool = ProcessPoolExecutor(
+            self.processes,
+            initializer=_initialize_projection_worker,
+            initargs=(
+                self.memory.name,
+                layout,
+                len(projection),
+                get_section_index(projection).resolution,
+            ),
+        )
+
+    def project_points(
+        self,
+        points: NDArray[ΦΛPoint],
+        chunk_size: Optional[int] = None,
+        first_index: int = 0,
+    ) -> NDArray[XYPoint]:
+        """apply the projection to a list of lat/lon points, splitting them among the
+        processes.  the points are copied into shared memory once, and each worker
+        writes its part of the result directly into a shared output buffer.
+        :param chunk_size: the number of points to send to a worker at a time (by
+                           default, enough for each process to get a few chunks)
+        :param first_index: the index of the first point in the full input, for error
+                            messages
+        """
+        points = points.ravel()
+        if chunk_size is None:
+            chunk_size = max(
+                1, min(CHUNK_SIZE, ceil(points.size / (4 * self.processes)))
+            )
+        input_memory, input_layout = share_arrays({"points": points})
+        output_memory, output_layout = share_arrays(
+            {"points": np.empty(points.size, dtype=XYPoint)}
+        )
+        try:
+            futures = [
+                self.pool.submit(
+                    _project_shared_points,
+                    input_memory.name,
+                    input_layout,
+                    output_memory.name,
+                    output_layout,
+                    start,
+                    min(start + chunk_size, points.size),
+                    first_index,
                 )
-            # check that each point was projected by at least one section
-            assert not np.any(np.isnan(projected_line["x"]))
-            projected_lines.append(projected_line)
-        projected_features.append((category, width, projected_lines))
-    # print(f"projected {len(projected_features)} features!")
-    return projected_features
+                for start in range(0, points.size, chunk_size)
+            ]
+            for future in futures:
+                future.result()
+            result = np.copy(attach_arrays(output_memory, output_layout)["points"])
+        finally:
+            for memory in [input_memory, output_memory]:
+                memory.close()
+                memory.unlink()
+        return result
+
+    def close(self) -> None:
+        self.pool.shutdown()
+        self.memory.close()
+        self.memory.unlink()
+
+    def __enter__(self) -> "ParallelProjector":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+# the pools that project_points keeps running between calls, which get stopped when
+# they’re pushed out or when Python exits
+_parallel_projectors = SectionCache(max_size=2, on_evict=ParallelProjector.close)
+atexit.register(_parallel_projectors.clear)
+
+
+SharedLayout = list[tuple[str, int, tuple[int, ...], np.dtype]]
+
+
+def share_arrays(arrays: dict[str, NDArray[Any]]) -> tuple[SharedMemory, SharedLayout]:
+    """copy a bunch of arrays into a single block of shared memory
+    :return: the shared memory and a description of where each array is in it, which can
+             be passed to another process along with the memory’s name
+    """
+    layout: SharedLayout = []
+    size = 0
+    for name, array in arrays.items():
+        size = ceil(size / 16) * 16  # keep everything aligned
+        layout.append((name, size, array.shape, array.dtype))
+        size += array.nbytes
+    memory = SharedMemory(create=True, size=max(1, size))
+    for name, view in attach_arrays(memory, layout).items():
+        view[...] = arrays[name]
+    return memory, layout
+
+
+def attach_arrays(
+    memory: SharedMemory, layout: SharedLayout
+) -> dict[str, NDArray[Any]]:
+    """get views of the arrays in a block of shared memory made by share_arrays"""
+    return {
+        name: np.ndarray(shape, dtype=dtype, buffer=memory.buf, offset=offset)
+        for name, offset, shape, dtype in layout
+    }
+
+
+_worker_memory: Optional[SharedMemory] = None
+_worker_projection: Optional[list[Section]] = None
+
+
+def _initialize_projection_worker(
+    name: str, layout: SharedLayout, number_of_sections: int, resolution: float
+) -> None:
+    """rebuild the projection in a worker process from the shared memory"""
+    global _worker_memory, _worker_projection
+    _worker_memory = SharedMemory(name)
+    arrays = attach_arrays(_worker_memory, layout)
+    _worker_projection = [
+        Section(
+            arrays[f"section {h}/latitude"],
+            arrays[f"section {h}/longitude"],
+            arrays[f"section {h}/projected points"],
+            arrays[f"section {h}/boundary"],
+        )
+        for h in range(number_of_sections)
+    ]
+    _section_indices.put(
+        _worker_projection,
+        SectionIndex(_worker_projection, resolution, owners=arrays["owners"]),
+    )
+
+
+def _project_shared_points(
+    input_name: str,
+    input_layout: SharedLayout,
+    output_name: str,
+    output_layout: SharedLayout,
+    start: int,
+    stop: int,
+    first_index: int,
+) -> None:
+    """project one chunk of the shared input into the shared output, in a worker"""
+    input_memory = SharedMemory(input_name)
+    output_memory = SharedMemory(output_name)
+    try:
+        points = attach_arrays(input_memory, input_layout)["points"]
+        result = attach_arrays(output_memory, output_layout)["points"]
+        result[start:stop] = project_points(
+            points[start:stop], _worker_projection, first_index=first_index + start
+        )
+        del points, result  # the views must be gone before the memory can be closed
+    finally:
+        input_memory.close()
+        output_memory.close()
+
+
+def open_point_file(path: FilePath | str, dtype: np.dtype = ΦΛPoint) -> NDArray[Any]:
+    """memory-map a file of points
+    :param path: either a .npy file or a raw binary file of structured records
+    :param dtype: the type of the records, if it’s a raw binary file
+    """
+    path = FilePath(path)
+    if path.suffix == ".npy":
+        return np.load(path, mmap_mode="r")
+    else:
+        return np.memmap(path, dtype=dtype, mode="r")
+
+
+def iterate_chunks(
+    source: NDArray[Any] | Iterable[NDArray[Any]] | FilePath | str,
+    chunk_size: int = CHUNK_SIZE,
+) -> Iterator[tuple[int, NDArray[Any]]]:
+    """break a large set of points into chunks no bigger than chunk_size
+    :param source: an array (or memmap), the path to a file of points, or an iterable of
+                   chunks
+    :return: the index of the first point of each chunk in the full input, and the chunk
+             itself
+    """
+    if isinstance(source, (str, FilePath)):
+        source = open_point_file(source)
+    if isinstance(source, np.ndarray):
+        source = [source.ravel()]
+    start = 0
+    for chunk in source:
+        chunk = chunk.ravel()
+        for offset in range(0, chunk.size, chunk_size):
+            yield start + offset, chunk[offset : offset + chunk_size]
+        start += chunk.size
+
+
+def project_point_chunks(
+    source: NDArray[ΦΛPoint] | Iterable[NDArray[ΦΛPoint]] | FilePath | str,
+    projection: list[Section],
+    chunk_size: int = CHUNK_SIZE,
+) -> Iterator[NDArray[XYPoint]]:
+    """apply the given Elastic projection to an arbitrarily large set of points, one
+    chunk at a time, so that only one chunk ever needs to be in memory
+    :param source: an array (or memmap), the path to a file of points, or an iterable of
+                   chunks
+    :param projection: the sections that comprise the projection
+    :param chunk_size: the maximum number of points to project at once
+    :return: the projected points, in chunks of at most chunk_size
+    :raise UnprojectablePointsError: if any point can’t be projected, with the offending
+                                     indices from whichever chunk it was in
+    """
+    for start, chunk in iterate_chunks(source, chunk_size):
+        yield project_points(chunk, projection, first_index=start)
+
+
+def project_points_to_file(
+    source: NDArray[ΦΛPoint] | Iterable[NDArray[ΦΛPoint]] | FilePath | str,
+    destination: FilePath | str,
+    projection: list[Section],
+    chunk_size: int = CHUNK_SIZE,
+) -> NDArray[XYPoint]:
+    """apply the given Elastic projection to an arbitrarily large set of points, writing
+    the result to disk one chunk at a time
+    :param source: an array (or memmap), the path to a file of points, or an iterable of
+                   chunks
+    :param destination: the file to write; if it ends in .npy it will be a .npy file,
+                        which means the source can’t be an iterable, since we need to
+                        know its length up front; otherwise it will be a raw binary file
+                        of XYPoints
+    :param projection: the sections that comprise the projection
+    :param chunk_size: the maximum number of points to project at once
+    :return: the result, memory-mapped
+    """
+    destination = FilePath(destination)
+    if isinstance(source, (str, FilePath)):
+        source = open_point_file(source)
+    if destination.suffix == ".npy":
+        if not isinstance(source, np.ndarray):
+            raise ValueError(
+                "to write a .npy file I need to know how many points there are up "
+                "front, so the source must be an array or a file"
+            )
+        result = np.lib.format.open_memmap(
+            destination, mode="w+", dtype=XYPoint, shape=(source.size,)
+        )
+        for start, chunk in iterate_chunks(source, chunk_size):
+            result[start : start + chunk.size] = project_points(
+                chunk, projection, first_index=start
+            )
+        result.flush()
+        return result
+    else:
+        with open(destination, "wb") as file:
+            for projected_chunk in project_point_chunks(source, projection, chunk_size):
+                file.write(projected_chunk.tobytes())
+        return open_point_file(destination, XYPoint)
+
+
+def project(
+    features: list[ΦΛFeature] | PackedFeatures,
+    projection: list[Section],
+    processes: int = 1,
+) -> list[XYFeature] | PackedFeatures:
+    """apply the given Elastic projection, defined by a list of sections, to the given
+    series of latitudes and longitudes.  all of the points are projected in one pass.
+    :param features: the features to project, either as a list or packed (the packed
+                     points can be CompactPoints)
+    :param projection: the sections that comprise the projection
+    :param processes: the number of processes to spread the work across (see
+                      project_points)
+    :return: the projected features, in the same representation as the input
+    """
+    if not isinstance(features, PackedFeatures):
+        return project(PackedFeatures.pack(features), projection, processes).unpack()
+    with stage("project", features.points.size):
+        with stage("locate", features.points.size):
+            owners = get_section_index(projection).locate(features.points)
+        # project_points checks that each point was projected by at least one section
+        with stage("project_points", features.points.size):
+            projected_points = project_points(
+                features.points, projection, processes=processes, owners=owners
+            )
+        projected_features = features.with_points(projected_points)
+        projected_features.crosses_interruption = find_interruption_crossings(
+            features.points,
+            projected_points,
+            owners,
+            features.get_previous_indices(wrap=True),
+            projection,
+        )
+        return projected_features
+
+
+def find_interruption_crossings(
+    points: NDArray[ΦΛPoint] | CompactPoints,
+    projected_points: NDArray[XYPoint] | CompactPoints,
+    owners: NDArray[int],
+    previous: NDArray[int],
+    projection: list[Section],
+) -> NDArray[bool]:
+    """find the segments of some lines that jump across an interruption.  a line can
+    only do that where it moves from one Section to another, but it might instead be
+    crossing a seam where the two Sections meet continuously.  to tell them apart, each
+    point that moves is projected with the previous point’s Section as well; at a seam
+    both Sections put it in about the same place (within SEAM_TOLERANCE), and across an
+    interruption they don’t.
+    :param points: the points on the globe (deg)
+    :param projected_points: the same points projected (km)
+    :param owners: the index of the Section that contains each point
+    :param previous: the index of the point before each point in its line
+    :param projection: the sections that comprise the projection
+    :return: whether each point is across an interruption from the point before it
+    """
+    crossings = np.full(owners.size, False)
+    if owners.size == 0:
+        return crossings
+    previous_owners = owners[previous]
+    for h, section in enumerate(projection):
+        moved = np.nonzero((owners != previous_owners) & (previous_owners == h))[0]
+        if moved.size == 0:
+            continue
+        moved_points = points[moved]
+        if isinstance(moved_points, CompactPoints):
+            moved_points = moved_points.to_records()
+        according_to_previous = section.get_planar_coordinates(moved_points)
+        gaps = np.hypot(
+            according_to_previous["x"] - projected_points["x"][moved],
+            according_to_previous["y"] - projected_points["y"][moved],
+        )
+        crossings[moved] = ~(
+            gaps <= SEAM_TOLERANCE
+        )  # where the previous Section has no value, it’s a gap
+    return crossings
 
 
 def cut_lines_that_cross_interruptions(
-    features: list[XYFeature], closed: bool
-) -> list[XYFeature]:
-    """if you naively project lines on a map projection that are not pre-cut at the interruptions,
-    you’ll get a lot of extraneous lines crisscrossing the map.  this function deals with that
-    problem by cutting any lines that seem suspiciusly long.
-    :param features: the data to investigate and adjust
-    :param closed: whether to worry about forming closed paths from the continuus regions of each line
+    features: list[XYFeature] | PackedFeatures, closed: bool
+) -> list[XYFeature] | PackedFeatures:
+    """if you naively project lines on a map projection that are not pre-cut at the
+    interruptions, you’ll get a lot of extraneous lines crisscrossing the map.  this
+    function deals with that problem by cutting any lines that seem suspiciusly long.
+    if the features came from project, it also cuts wherever a line jumps from one
+    Section to another across an interruption (see find_interruption_crossings), which
+    catches the crossings that are too short to look suspicious.
+    :param features: the data to investigate and adjust, either as a list or packed (the
+                     packed points can be CompactPoints)
+    :param closed: whether to worry about forming closed paths from the continuus
+                   regions of each line
+    :return: the cut features, in the same representation as the input
     """
+    if not isinstance(features, PackedFeatures):
+        return cut_lines_that_cross_interruptions(
+            PackedFeatures.pack(features, XYPoint), closed
+        ).unpack()
+    # the cutting and merging work on whole lines, so compact points go thru records
+    if isinstance(features.points, CompactPoints):
+        cut_features = cut_lines_that_cross_interruptions(
+            features.with_points(features.points.to_records()), closed
+        )
+        return cut_features.with_points(
+            CompactPoints.from_records(cut_features.points, features.points.dtype)
+        )
+
+    # start by finding line segments longer than SNIPPING_LENGTH, for all lines at once
+    previous = features.get_previous_indices(wrap=closed)
+    lengths = np.hypot(
+        features.points["x"] - features.points["x"][previous],
+        features.points["y"] - features.points["y"][previous],
+    )
+    is_a_cut = lengths > SNIPPING_LENGTH
+    # and the ones that cross an interruption, however short they are
+    if features.crosses_interruption is not None:
+        is_a_cut |= features.crosses_interruption
+    if not closed:
+        line_starts = features.line_offsets[:-1]
+        is_a_cut[line_starts[features.line_offsets[1:] > line_starts]] = False
+    all_cuts = np.nonzero(is_a_cut)[0]
+    # note where each line’s cuts are in that list
+    cut_offsets = np.searchsorted(all_cuts, features.line_offsets)
+
     new_features: list[XYFeature] = []
-    for category, width, lines in features:
+    for i in range(len(features)):
         new_lines: list[XYLine] = []
         new_lines_to_be_merged: list[XYLine] = []
-        for line in lines:
-            # start by finding line segments longer than 100 km
-            j = np.arange(0 if closed else 1, line.size)
-            lengths = np.hypot(
-                line["x"][j] - line["x"][j - 1], line["y"][j] - line["y"][j - 1]
+        for j in range(features.feature_offsets[i], features.feature_offsets[i + 1]):
+            line = features.line(j)
+            cuts = (
+                all_cuts[cut_offsets[j] : cut_offsets[j + 1]] - features.line_offsets[j]
             )
-            cuts = j[np.nonzero(lengths > SNIPPING_LENGTH)[0]]
             # don’t try to do anything if there are not cuts
             if cuts.size == 0:
                 new_lines.append(line)
             else:
                 if closed:
-                    # cycle the points based on the discontinuities you found so it starts and ends with one
+                    # cycle the points based on the discontinuities you found so it
+                    # starts and ends with one
                     line = np.roll(line, -cuts[0])
                     cuts = np.concatenate([cuts - cuts[0], [line.size]])
                 else:
@@ -243,80 +2134,593 @@ def cut_lines_that_cross_interruptions(
         new_lines_to_be_merged = sorted(
             new_lines_to_be_merged, key=lambda feature: len(feature[1])
         )
-        # go thru all of these lines that are not finalized
         if len(new_lines_to_be_merged) > 0:
-            merged_line: Optional[XYLine] = None
-            while True:
-                if merged_line is not None:
-                    # take the endpoint of you current line
-                    endpoint = merged_line[-1]
-                    potential_next_startpoints = np.array(
-                        [line[0] for line in new_lines_to_be_merged] + [merged_line[0]]
-                    )
-                    # and find the pending startpoint closest to it
-                    next_index = np.argmin(
-                        np.hypot(
-                            potential_next_startpoints["x"] - endpoint["x"],
-                            potential_next_startpoints["y"] - endpoint["y"],
-                        )
-                    )
-                    # if that nearest startpoint is its own, close it and finish it
-                    if next_index == len(new_lines_to_be_merged):
-                        new_lines.append(merged_line)
-                        merged_line = None
-                    # if the nearest startpoint is a different segment, merge them
-                    else:
-                        next_line = new_lines_to_be_merged.pop(next_index)
-                        merged_line = np.concatenate([merged_line, next_line])
-                else:
-                    if len(new_lines_to_be_merged) > 0:
-                        # arbitrarily take the next pending line whenever we need to restart
-                        merged_line = new_lines_to_be_merged.pop()
-                    else:
-                        # stop when we run out of lines to be merged
-                        break
-        new_features.append((category, width, new_lines))
-    return new_features
+            new_lines += merge_lines_into_rings(new_lines_to_be_merged)
+        new_features.append(
+            (int(features.categories[i]), float(features.widths[i]), new_lines)
+        )
+    return PackedFeatures.pack(new_features, XYPoint)
+
+
+class OverlayCache:
+    FIELDS = ["points", "line_offsets", "feature_offsets", "categories", "widths"]
+
+    def __init__(
+        self,
+        directory: FilePath | str = OVERLAY_CACHE_DIR,
+        max_size: int = OVERLAY_CACHE_SIZE,
+    ):
+        """a directory of projected and cut overlay geometry, so that we don’t have to
+        load, project, and cut the same shapefile every time we draw it.  each entry is
+        keyed by the contents of the shapefile and the projection file and by the
+        rotation, and is stored as a folder of .npy files that get memory-mapped when
+        loaded.  when the directory gets bigger than max_size, the least recently used
+        entries are deleted.
+        :param directory: the folder in which to keep the entries
+        :param max_size: the most space the entries may take up in total (bytes)
+        """
+        self.directory = FilePath(directory)
+        self.max_size = max_size
+
+    def get_key(
+        self,
+        shapefile_path: FilePath | str,
+        projection_path: FilePath | str,
+        rotation_deg: float,
+        tolerance: Optional[float] = None,
+        region: Optional[tuple[float, float, float, float]] = None,
+    ) -> str:
+        """work out the name of the entry for the given inputs.  besides the inputs, the
+        key includes OVERLAY_CACHE_VERSION, SNIPPING_LENGTH, and SEAM_TOLERANCE, so that
+        entries made by older code or with other settings are never served.
+        :param tolerance: the tolerance to which the lines were simplified, if they were
+                          (km)
+        :param region: the box on the globe to which the features were culled, if they
+                       were (deg)
+        """
+        hasher = hashlib.sha256()
+        hasher.update(f"version {OVERLAY_CACHE_VERSION}".encode())
+        hasher.update(f"snipping length {SNIPPING_LENGTH!r}".encode())
+        hasher.update(f"seam tolerance {SEAM_TOLERANCE!r}".encode())
+        hasher.update(hash_file(shapefile_path).encode())
+        hasher.update(hash_file(projection_path).encode())
+        hasher.update(repr(float(rotation_deg)).encode())
+        if tolerance is not None:
+            hasher.update(f"simplified to {float(tolerance)!r}".encode())
+        if region is not None:
+            hasher.update(
+                f"culled to {tuple(float(edge) for edge in region)!r}".encode()
+            )
+        return hasher.hexdigest()[:32]
+
+    def load(self, key: str) -> Optional[tuple[PackedFeatures, bool]]:
+        """read an entry from the cache, if it’s there
+        :return: the projected and cut features and whether they’re closed, or None if
+                 it’s a miss
+        """
+        entry = self.directory / key
+        if not entry.is_dir():
+            return None
+        try:
+            arrays = [
+                np.load(entry / f"{field}.npy", mmap_mode="r")
+                for field in OverlayCache.FIELDS
+            ]
+            closed = bool(np.load(entry / "closed.npy"))
+            os.utime(entry)  # mark it as recently used
+        except (
+            OSError,
+            ValueError,
+        ):  # if the entry is corrupted or was just evicted, it’s a miss
+            return None
+        return PackedFeatures(*arrays), closed
+
+    def save(self, key: str, features: PackedFeatures, closed: bool) -> None:
+        """write an entry to the cache, then evict old entries if it’s too big"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # write it to a temporary folder first so that no one ever sees a partial entry
+        temporary = FilePath(tempfile.mkdtemp(dir=self.directory, prefix=".partial-"))
+        for field in OverlayCache.FIELDS:
+            np.save(
+                temporary / f"{field}.npy",
+                np.ascontiguousarray(getattr(features, field)),
+            )
+        np.save(temporary / "closed.npy", np.array(closed))
+        try:
+            temporary.rename(self.directory / key)
+        except OSError:  # someone else already saved this entry
+            shutil.rmtree(temporary, ignore_errors=True)
+        self.evict()
+
+    def evict(self) -> None:
+        """delete the least recently used entries until the cache fits in max_size.
+        other processes may be saving to or evicting from the same directory at the same
+        time, so any entry that disappears while we look at it is just skipped.
+        """
+        entries = []
+        for entry in self.directory.iterdir():
+            if entry.is_dir() and not entry.name.startswith("."):
+                try:
+                    size = sum(file.stat().st_size for file in entry.iterdir())
+                    entries.append((entry.stat().st_mtime, size, entry))
+                except FileNotFoundError:  # someone else evicted it
+                    continue
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total_size -= size
+
+    def invalidate(self, key: Optional[str] = None) -> None:
+        """delete one entry from the cache, or every entry if no key is given"""
+        if key is not None:
+            shutil.rmtree(self.directory / key, ignore_errors=True)
+        elif self.directory.is_dir():
+            for entry in self.directory.iterdir():
+                if entry.is_dir():
+                    shutil.rmtree(entry, ignore_errors=True)
+
+
+_file_hashes: dict[tuple[str, int, int], str] = {}
 
 
-def add_data_to_ax(ax, data_name, style, zorder, sections, rotation_deg=0):
+def hash_file(path: FilePath | str) -> str:
+    """compute the SHA-256 hash of a file, reusing it if the file hasn’t changed"""
+    path = FilePath(path).resolve()
+    status = path.stat()
+    signature = (str(path), status.st_mtime_ns, status.st_size)
+    if signature not in _file_hashes:
+        hasher = hashlib.sha256()
+        with open(path, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                hasher.update(block)
+        _file_hashes[signature] = hasher.hexdigest()
+    return _file_hashes[signature]
+
+
+def merge_lines_into_rings(lines: list[XYLine]) -> list[XYLine]:
+    """join a set of open lines end to start into closed rings.  starting from the last
+    pending line, it repeatedly attaches whichever pending line starts closest to the
+    current end, and closes the ring once its own start is at least as close as any of
+    them.  the pending start points are kept in a k-d tree, so this takes O(n log n)
+    rather than O(n²).
+    :param lines: the lines to join; where distances tie, the earlier line in the list
+                  wins
+    :return: the closed rings
+    """
+    starts = np.array([line[0] for line in lines], dtype=XYPoint)
+    tree = cKDTree(np.stack([starts["x"], starts["y"]], axis=-1))
+    is_pending = np.full(len(lines), True)
+    num_pending = len(lines)
+    last_pending = len(lines) - 1
+
+    def find_nearest_pending(endpoint: NDArray[XYPoint]) -> tuple[Optional[int], float]:
+        """find the closest pending start point and its distance from the endpoint"""
+        # find the nearest pending point according to the tree
+        k = 1
+        while True:
+            k = min(2 * k, len(lines))
+            tree_distances, indices = tree.query((endpoint["x"], endpoint["y"]), k=k)
+            tree_distances, indices = np.atleast_1d(tree_distances), np.atleast_1d(
+                indices
+            )
+            found = is_pending[indices]
+            if np.any(found) or k == len(lines):
+                break
+        if not np.any(found):
+            return None, inf
+        # then get everything that might tie with it, and compare the distances exactly
+        nearest_distance = tree_distances[np.argmax(found)]
+        candidates = np.array(
+            tree.query_ball_point(
+                (endpoint["x"], endpoint["y"]), nearest_distance * (1 + 1e-9) + 1e-9
+            ),
+            dtype=int,
+        )
+        candidates = np.sort(candidates[is_pending[candidates]])
+        distances = np.hypot(
+            starts["x"][candidates] - endpoint["x"],
+            starts["y"][candidates] - endpoint["y"],
+        )
+        best = np.argmin(distances)
+        return candidates[best], distances[best]
+
+    rings: list[XYLine] = []
+    while num_pending > 0:
+        # arbitrarily take the last pending line whenever we need to restart
+        while not is_pending[last_pending]:
+            last_pending -= 1
+        ring = [lines[last_pending]]
+        is_pending[last_pending] = False
+        num_pending -= 1
+        while True:
+            # take the endpoint of you current line and find the pending startpoint
+            # closest to it
+            endpoint = ring[-1][-1]
+            next_index, next_distance = (
+                find_nearest_pending(endpoint) if num_pending > 0 else (None, inf)
+            )
+            own_distance = np.hypot(
+                ring[0][0]["x"] - endpoint["x"], ring[0][0]["y"] - endpoint["y"]
+            )
+            # if that nearest startpoint is its own, close it and finish it
+            if next_index is None or own_distance < next_distance:
+                rings.append(np.concatenate(ring))
+                break
+            # if the nearest startpoint is a different segment, merge them
+            else:
+                ring.append(lines[next_index])
+                is_pending[next_index] = False
+                num_pending -= 1
+    return rings
+
+
+def simplify_lines(
+    features: PackedFeatures, tolerance: float, closed: bool
+) -> PackedFeatures:
+    """remove the vertices that don’t noticeably change the shape of each line, using
+    the Douglas–Peucker algorithm: keep each line’s endpoints, then repeatedly keep the
+    vertex farthest from the segment between the kept vertices on either side of it
+    until every vertex is within the tolerance of its segment.  all of the lines are
+    done at once, one level of splitting at a time.  the vertices that are kept are
+    exactly the original ones.
+    :param features: the projected features to simplify
+    :param tolerance: how far each removed vertex may be from the simplified line (km)
+    :param closed: whether each line is a ring, in which case the segment from its last
+                   vertex back to its first counts too, and each ring keeps at least
+                   three vertices so that it still encloses something
+    :return: the simplified features
+    """
+    if isinstance(features.points, CompactPoints):
+        simplified = simplify_lines(
+            features.with_points(features.points.to_records()), tolerance, closed
+        )
+        return simplified.with_points(
+            CompactPoints.from_records(simplified.points, features.points.dtype)
+        )
+
+    x, y = features.points["x"], features.points["y"]
+    line_starts = features.line_offsets[:-1]
+    line_ends = features.line_offsets[1:] - 1
+    nonempty = line_ends >= line_starts
+    keep = np.full(features.points.size, False)
+    keep[line_starts[nonempty]] = True
+    keep[line_ends[nonempty]] = True
+
+    def find_farthest(starts, ends, reference_starts, reference_ends):
+        """find the vertex between each start and end (exclusive) that is farthest from
+        the segment from the corresponding reference start to reference end
+        :return: the index of each farthest vertex, and its distance from the segment
+                 (km).  ranges with nothing in them get -1 and -inf.
+        """
+        counts = np.maximum(ends - starts - 1, 0)
+        farthest = np.full(starts.size, -1)
+        distances = np.full(starts.size, -inf)
+        if np.sum(counts) == 0:
+            return farthest, distances
+        group = np.repeat(np.arange(starts.size), counts)
+        group_offsets = np.cumsum(counts) - counts
+        indices = starts[group] + 1 + np.arange(group.size) - group_offsets[group]
+        x_0, y_0 = x[reference_starts[group]], y[reference_starts[group]]
+        dx, dy = x[reference_ends[group]] - x_0, y[reference_ends[group]] - y_0
+        length2 = dx**2 + dy**2
+        t = np.clip(
+            ((x[indices] - x_0) * dx + (y[indices] - y_0) * dy)
+            / np.where(length2 > 0, length2, 1),
+            0,
+            1,
+        )
+        distance = np.hypot(x[indices] - (x_0 + t * dx), y[indices] - (y_0 + t * dy))
+        nonempty_groups = np.nonzero(counts > 0)[0]
+        maxima = np.maximum.reduceat(distance, group_offsets[nonempty_groups])
+        is_maximum = distance == np.repeat(maxima, counts[nonempty_groups])
+        positions = np.nonzero(is_maximum)[0]
+        _, first = np.unique(group[positions], return_index=True)
+        farthest[nonempty_groups] = indices[positions[first]]
+        distances[nonempty_groups] = maxima
+        return farthest, distances
+
+    # a ring has no natural endpoints, so split it at its first vertex and the vertex
+    # farthest from that
+    if closed:
+        starts, ends = line_starts[nonempty], line_ends[nonempty]
+        farthest, _ = find_farthest(starts - 1, ends + 1, starts, starts)
+        has_far_point = farthest >= 0
+        keep[farthest[has_far_point]] = True
+        segment_starts = np.concatenate([starts, farthest[has_far_point]])
+        segment_ends = np.concatenate(
+            [np.where(has_far_point, farthest, ends), ends[has_far_point]]
+        )
+    else:
+        segment_starts, segment_ends = line_starts[nonempty], line_ends[nonempty]
+
+    # then split every segment that strays too far until none do
+    while segment_starts.size > 0:
+        farthest, distances = find_farthest(
+            segment_starts, segment_ends, segment_starts, segment_ends
+        )
+        split = distances > tolerance
+        keep[farthest[split]] = True
+        segment_starts, segment_ends = (
+            np.concatenate([segment_starts[split], farthest[split]]),
+            np.concatenate([farthest[split], segment_ends[split]]),
+        )
+
+    # make sure every ring still has some area
+    if closed:
+        kept_counts = (
+            np.add.reduceat(keep, line_starts[nonempty]) if np.any(nonempty) else []
+        )
+        for start, end in zip(
+            line_starts[nonempty][kept_counts < 3], line_ends[nonempty][kept_counts < 3]
+        ):
+            if end - start >= 2:
+                farthest, _ = find_farthest(
+                    np.array([start]),
+                    np.array([end]),
+                    np.array([start]),
+                    np.array([end]),
+                )
+                keep[farthest] = True
+
+    kept = np.nonzero(keep)[0]
+    line_offsets = np.searchsorted(kept, features.line_offsets)
+    return PackedFeatures(
+        features.points[kept],
+        line_offsets,
+        features.feature_offsets,
+        features.categories,
+        features.widths,
+    )
+
+
+def cull_features(
+    features: PackedFeatures, region: tuple[float, float, float, float]
+) -> PackedFeatures:
+    """leave out the features and lines that are nowhere near a box on the globe, using
+    each one’s envelope, so that they don’t have to be projected
+    :param features: the features, in latitude and longitude
+    :param region: the south, north, west, and east edges of the box (deg)
+    :return: the features whose envelopes overlap the box, with only their lines that do
+             too
+    """
+    ф_min, ф_max, λ_min, λ_max = region
+
+    def overlaps(lower, upper):
+        return (
+            (lower["latitude"] <= ф_max)
+            & (upper["latitude"] >= ф_min)
+            & (lower["longitude"] <= λ_max)
+            & (upper["longitude"] >= λ_min)
+        )
+
+    # check the features first, then the lines of the ones that are left
+    nearby_features = overlaps(*features.get_envelopes())
+    feature_of_line = np.repeat(
+        np.arange(len(features)), np.diff(features.feature_offsets)
+    )
+    nearby_lines = (
+        overlaps(*features.get_envelopes(by_line=True))
+        & nearby_features[feature_of_line]
+    )
+    lines_per_feature = np.bincount(
+        feature_of_line[nearby_lines], minlength=len(features)
+    )
+    return features.subset(np.nonzero(lines_per_feature > 0)[0], nearby_lines)
+
+
+def add_data_to_ax(
+    ax,
+    data_name,
+    style,
+    zorder,
+    sections,
+    rotation_deg=0,
+    projection_path=None,
+    cache=None,
+    tolerance=None,
+    region=None,
+):
+    """project some geographic data and draw it
+    :param data_name: either the name or path of a shapefile to load, or the features to
+                      draw (a list or PackedFeatures of latitudes and longitudes) and
+                      whether they are closed
+    :param projection_path: the hdf5 file from which the sections were loaded; the cache
+                            is only used if this is given
+    :param cache: the OverlayCache in which to look for (and save) the projected data
+    :param tolerance: how far the drawn lines may stray from the real ones so that they
+                      can be drawn with fewer vertices (km); about half a pixel is a
+                      good choice.  if it’s None, every vertex is drawn.
+    :param region: the south, north, west, and east edges of the part of the globe that
+                   will be shown (deg), so that the features nowhere near it can be
+                   skipped; None to draw everything
+    """
+    with stage("add_data_to_ax"):
+        projected_data, closed = load_projected_data(
+            data_name, sections, rotation_deg, projection_path, cache, tolerance, region
+        )
+        with stage("draw", projected_data.points.size):
+            draw_projected_data(ax, projected_data, closed, style, zorder)
+
+
+def load_projected_data(
+    data_name,
+    sections,
+    rotation_deg=0,
+    projection_path=None,
+    cache=None,
+    tolerance=None,
+    region=None,
+) -> tuple[PackedFeatures, bool]:
+    """get some geographic data projected, cut at the interruptions, rotated, and
+    (optionally) simplified, ready to draw
+    :param data_name: either the name or path of a shapefile to load, or the features to
+                      draw (a list or PackedFeatures of latitudes and longitudes) and
+                      whether they are closed
+    :param projection_path: the hdf5 file from which the sections were loaded; the cache
+                            is only used if this is given
+    :param cache: the OverlayCache in which to look for (and save) the projected data.
+                  the simplified data is cached separately for each tolerance.
+    :param tolerance: the tolerance to which to simplify the lines, if at all (km)
+    :param region: the box on the globe outside of which to leave out features before
+                   projecting them (south, north, west, and east edges, in deg), if any.
+                   the culled data is cached separately for each region.
+    :return: the projected features, and whether they are closed
+    """
+    use_cache = (
+        cache is not None
+        and projection_path is not None
+        and isinstance(data_name, (str, FilePath))
+    )
+    if tolerance is not None:
+        cached = None
+        if use_cache:
+            with stage("load from cache"):
+                key = cache.get_key(
+                    get_shapefile_path(data_name),
+                    projection_path,
+                    rotation_deg,
+                    tolerance,
+                    region,
+                )
+                cached = cache.load(key)
+            log(
+                f"overlay cache {'hit' if cached is not None else 'miss'} for "
+                f"{data_name} simplified to {tolerance:.3g} km"
+            )
+        if cached is not None:
+            return cached
+        projected_data, closed = load_projected_data(
+            data_name, sections, rotation_deg, projection_path, cache, region=region
+        )
+        with stage("simplify", projected_data.points.size):
+            projected_data = simplify_lines(projected_data, tolerance, closed)
+        if use_cache:
+            cache.save(key, projected_data, closed)
+        return projected_data, closed
+
+    cached = None
+    if use_cache:
+        with stage("load from cache"):
+            key = cache.get_key(
+                get_shapefile_path(data_name),
+                projection_path,
+                rotation_deg,
+                region=region,
+            )
+            cached = cache.load(key)
+        log(f"overlay cache {'hit' if cached is not None else 'miss'} for {data_name}")
+    if cached is not None:
+        projected_data, closed = cached
+    else:
+        with stage("load"):
+            if isinstance(data_name, (str, FilePath)):
+                unprojected_data, closed = load_packed_geographic_data(data_name)
+            else:
+                unprojected_data, closed = data_name
+            if not isinstance(unprojected_data, PackedFeatures):
+                unprojected_data = PackedFeatures.pack(unprojected_data)
+        if region is not None:
+            with stage("cull", unprojected_data.points.size):
+                unprojected_data = cull_features(unprojected_data, region)
+        # rotate the grids rather than the data; it’s cached, so it only happens once
+        if rotation_deg:
+            sections = transform_sections(sections, float(rotation_deg))
+        projected_data = project(unprojected_data, sections)
+        with stage("cut", projected_data.points.size):
+            projected_data = cut_lines_that_cross_interruptions(projected_data, closed)
+        if use_cache:
+            with stage("save to cache"):
+                cache.save(key, projected_data, closed)
+    return projected_data, closed
+
+
+def draw_projected_data(ax, projected_data, closed, style, zorder):
+    """draw some features that have already been projected, as a few artists per layer
+    rather than one per feature, but looking exactly like one PathPatch per polygon or
+    one ax.plot line per line would.  polygons go in a single PathCollection.
+    matplotlib simplifies lines with MIN_SIMPLIFIED_VERTICES or more vertices when
+    they’re drawn as Line2Ds, but never in a LineCollection (and joining lines into one
+    path would change how they blend where they overlap), so the long lines still get a
+    Line2D each, and each run of short lines between them, which is most of the lines,
+    goes in one LineCollection.
+    :param projected_data: the features (a list or PackedFeatures of x and y
+                           coordinates)
+    :param closed: whether to fill them in as polygons rather than drawing them as lines
+    """
+    if not isinstance(projected_data, PackedFeatures):
+        projected_data = PackedFeatures.pack(projected_data, dtype=XYPoint)
+    if isinstance(projected_data.points, CompactPoints):
+        projected_data = projected_data.with_points(projected_data.points.to_records())
+    if projected_data.points.size == 0:
+        return
     multiple_colors = "facecolor" in style and type(style["facecolor"]) is list
     multiple_widths = "linewidth" in style and style["linewidth"] == 0
-    unprojected_data, closed = load_geographic_data(data_name)
-    projected_data = project(unprojected_data, sections)
-    projected_data = cut_lines_that_cross_interruptions(projected_data, closed)
+    vertices = np.stack(
+        [projected_data.points["x"], projected_data.points["y"]], axis=-1
+    )
+    line_offsets = projected_data.line_offsets
+    feature_offsets = projected_data.feature_offsets
     if closed:
-        for category, width, lines in projected_data:
-            feature_specific_style = {**style}
-            if multiple_colors:
-                color_index = category % len(style["facecolor"])
-                feature_specific_style["facecolor"] = style["facecolor"][color_index]
-            if style["edgecolor"] == "facecolor":
-                feature_specific_style["edgecolor"] = feature_specific_style[
-                    "facecolor"
-                ]
-            points: list[tuple[float, float]] = []
-            codes: list[int] = []
-            for line in lines:
-                if rotation_deg:
-                    line = rotate_points(line, rotation_deg)
-                for k, point in enumerate(line):
-                    points.append((point["x"], point["y"]))
-                    codes.append(Path.MOVETO if k == 0 else Path.LINETO)
-                points.append((nan, nan))
-                codes.append(Path.CLOSEPOLY)
-            path = Path(points, codes)  # type: ignore
-            patch = PathPatch(path, zorder=zorder, **feature_specific_style)
-            ax.add_patch(patch)
+        # give each line a MOVETO, then LINETOs, then a CLOSEPOLY on an extra end vertex
+        line_lengths = np.diff(line_offsets)
+        line_ends = line_offsets[1:] + np.arange(1, line_lengths.size + 1)
+        path_vertices = np.insert(vertices, line_offsets[1:], nan, axis=0)
+        path_codes = np.full(path_vertices.shape[0], Path.LINETO, dtype=Path.code_type)
+        path_codes[line_ends[line_lengths > 0] - line_lengths[line_lengths > 0] - 1] = (
+            Path.MOVETO
+        )
+        path_codes[line_ends - 1] = Path.CLOSEPOLY
+        path_offsets = np.concatenate([[0], line_ends])[feature_offsets]
+        paths = [
+            Path(path_vertices[start:end], path_codes[start:end])
+            for start, end in zip(path_offsets[:-1], path_offsets[1:])
+        ]
+        feature_style = {**style}
+        if multiple_colors:
+            colors = style["facecolor"]
+            feature_style["facecolor"] = [
+                colors[category % len(colors)] for category in projected_data.categories
+            ]
+        if style["edgecolor"] == "facecolor":
+            feature_style["edgecolor"] = feature_style["facecolor"]
+        # match the caps and joins that a PathPatch would have had
+        feature_style.setdefault("capstyle", "butt")
+        feature_style.setdefault("joinstyle", "miter")
+        ax.add_collection(PathCollection(paths, zorder=zorder, **feature_style))
     else:
-        for category, width, lines in projected_data:
-            feature_specific_style = {**style}
-            if multiple_widths:
-                feature_specific_style["linewidth"] = width
-            for line in lines:
-                if rotation_deg:
-                    line = rotate_points(line, rotation_deg)
-                ax.plot(line["x"], line["y"], zorder=zorder, **feature_specific_style)
+        line_lengths = np.diff(line_offsets)
+        if multiple_widths:
+            line_widths = np.repeat(projected_data.widths, np.diff(feature_offsets))
+        else:
+            line_widths = np.full(
+                line_lengths.size, style.get("linewidth", rcParams["lines.linewidth"])
+            )
+        is_simplified = line_lengths >= MIN_SIMPLIFIED_VERTICES
+        if not (rcParams["path.simplify"] and rcParams["path.simplify_threshold"] > 0):
+            is_simplified[:] = False
+        # keep the lines in order, since that affects how they blend where they overlap
+        run_starts = np.nonzero(np.diff(is_simplified, prepend=True) | is_simplified)[0]
+        run_ends = np.append(run_starts[1:], line_lengths.size)
+        for start, end in zip(run_starts, run_ends):
+            lines = [
+                vertices[line_offsets[j] : line_offsets[j + 1]]
+                for j in range(start, end)
+            ]
+            if len(lines) == 1:
+                ax.plot(
+                    lines[0][:, 0],
+                    lines[0][:, 1],
+                    zorder=zorder,
+                    **{**style, "linewidth": line_widths[start]},
+                )
+            else:
+                line_style = {**style, "linewidth": line_widths[start:end]}
+                # match the caps and joins that ax.plot would have given each line
+                line_style.setdefault("capstyle", rcParams["lines.solid_capstyle"])
+                line_style.setdefault("joinstyle", rcParams["lines.solid_joinstyle"])
+                ax.add_collection(LineCollection(lines, zorder=zorder, **line_style))
 
 
 def copy_rotated_projection(input_path, output_path, rotation_deg):
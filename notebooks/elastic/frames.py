@@ -0,0 +1,323 @@
+import io
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from math import sqrt
+from pathlib import Path as FilePath
+
+import matplotlib.cm as mpcm
+import matplotlib.colors as mpcolors
+import matplotlib.image as mpimage
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from core import (
+    OVERLAY_CACHE_DIR,
+    OverlayCache,
+    load_elastic_projection,
+    add_data_to_ax,
+    project_points,
+)
+from instrumentation import stage, staged
+from plot_elastic import (
+    hex_to_rgb,
+    create_latlon_raster,
+    create_raster_lookup_table,
+    get_map_extent,
+    get_km_per_pixel,
+    turn_off_labels,
+    add_labels_to_ax,
+)
+
+
+@staged("render_frames")
+def render_frames(
+    foreground_rasters,
+    output,
+    mask=None,
+    cmap=mpcm.plasma,
+    background_color="#000000",
+    resolution=2000,
+    norm=mpcolors.LogNorm(vmin=1, vmax=10000, clip=True),
+    nominal_size=16,
+    dpi=300,
+    projection_name="Elastic-II",
+    add_shorelines_with_color=None,
+    add_rivers_with_color=None,
+    add_lakes_with_color=None,
+    alpha=1.0,
+    nominal_pixel_size=0.72,
+    rotation_deg=0,
+    add_labels=True,
+    render_mode="image",
+    overlay_cache_dir=OVERLAY_CACHE_DIR,
+    simplification_tolerance=0.5,
+    processes=None,
+):
+    """draw a series of lat/lon rasters of the same shape on an Elastic projection, as
+    the frames of an animation.  everything that doesn’t change from frame to frame –
+    which raster cell goes where, and the shorelines, rivers, lakes, and labels on top –
+    is worked out once, and then only the raster itself is drawn for each frame.  the
+    arguments mean the same as plot_elastic’s.
+    :param foreground_rasters: the rasters to draw: a 3-D array (or memmap) with one
+                               raster per frame along its first axis, or any iterable of
+                               2-D arrays
+    :param output: either a directory in which to save the frames as frame-00000.png,
+                   frame-00001.png, etc., or a function to call with the index and PNG
+                   image of each frame (to feed them into a video encoder, for example).
+                   either way, the frames arrive in order.
+    :param mask: which raster cells to draw, if not all of them; the same for every
+                 frame
+    :param norm: how to map the raster values to colors.  this must be the same for
+                 every frame, so it can’t autoscale.
+    :param processes: the number of processes to draw frames in (by default, one per
+                      CPU)
+    :return: the number of frames drawn
+    """
+    projection_path = f"../../projection/{projection_name}.h5"
+    sections, boundary, aspect_ratio = load_elastic_projection(projection_path)
+    if isinstance(background_color, str):
+        background_color = hex_to_rgb(background_color)
+    figsize = (nominal_size * sqrt(aspect_ratio), nominal_size / sqrt(aspect_ratio))
+    foreground_rasters = iter(foreground_rasters)
+    try:
+        first_raster = next(foreground_rasters)
+    except StopIteration:
+        return 0
+    shape = first_raster.shape
+    if mask is not None:
+        assert shape == mask.shape
+
+    # work out where each raster cell goes once
+    context = dict(
+        shape=shape,
+        figsize=figsize,
+        dpi=dpi,
+        cmap=cmap,
+        norm=norm,
+        alpha=alpha,
+        background_color=background_color,
+        render_mode=render_mode,
+    )
+    if render_mode == "image":
+        with stage("raster lookup table", resolution**2):
+            lookup_table, extent = create_raster_lookup_table(
+                shape, projection_path, resolution, rotation_deg
+            )
+        hidden = lookup_table < 0
+        if mask is not None:
+            hidden |= ~mask.ravel()[lookup_table]
+        context.update(lookup_table=lookup_table, hidden=hidden, extent=extent)
+    elif render_mode == "scatter":
+        latlon_raster = create_latlon_raster(np.empty(shape))
+        indices = np.arange(latlon_raster.size).reshape(shape)
+        if mask is not None:
+            latlon_raster = latlon_raster[mask]
+            indices = indices[mask]
+        rotated_sections, _, _ = load_elastic_projection(projection_path, rotation_deg)
+        with stage("project raster", latlon_raster.size):
+            xy_points = project_points(latlon_raster.flatten(), rotated_sections)
+        context.update(
+            xy_points=xy_points,
+            indices=indices.ravel(),
+            pixel_size=nominal_pixel_size * 3600 / shape[1],
+            extent=get_map_extent(projection_path, rotation_deg),
+        )
+    else:
+        raise ValueError(f"unrecognized render mode: '{render_mode}'")
+
+    # draw everything that goes on top of the raster once, on a transparent figure
+    figure, ax = _create_frame_figure(context)
+    ax.patch.set_visible(False)
+    if simplification_tolerance is not None:
+        overlay_tolerance = simplification_tolerance * get_km_per_pixel(
+            ax, projection_path, rotation_deg
+        )
+    else:
+        overlay_tolerance = None
+    overlay_cache = (
+        OverlayCache(overlay_cache_dir) if overlay_cache_dir is not None else None
+    )
+    for color, data_name, style in [
+        (
+            add_lakes_with_color,
+            "ne_110m_lakes",
+            dict(
+                facecolor=add_lakes_with_color,
+                edgecolor=add_lakes_with_color,
+                linewidth=0.2,
+            ),
+        ),
+        (
+            add_rivers_with_color,
+            "ne_50m_rivers_lake_centerlines_scale_rank",
+            dict(color=add_rivers_with_color, linewidth=0),
+        ),
+        (
+            add_shorelines_with_color,
+            "ne_50m_coastline",
+            dict(color=add_shorelines_with_color, linewidth=0.2),
+        ),
+    ]:
+        if color:
+            with stage(data_name):
+                add_data_to_ax(
+                    ax,
+                    data_name,
+                    style,
+                    zorder=2,
+                    sections=sections,
+                    rotation_deg=rotation_deg,
+                    projection_path=projection_path,
+                    cache=overlay_cache,
+                    tolerance=overlay_tolerance,
+                )
+    if add_labels:
+        add_labels_to_ax(ax, sections, dpi)
+    with stage("draw overlays"):
+        context["overlay_image"] = _render_figure(figure, ax, context["extent"])
+
+    tasks = (
+        (k, raster) for k, raster in enumerate(_chain(first_raster, foreground_rasters))
+    )
+    if processes == 1:
+        _initialize_frame_worker(context)
+        results = map(_render_frame, tasks)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(
+            processes, initializer=_initialize_frame_worker, initargs=(context,)
+        )
+        results = _map_in_order(
+            executor, _render_frame, tasks, 2 * (processes or os.cpu_count())
+        )
+    if not callable(output):
+        directory = FilePath(output)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        def output(k, image):
+            (directory / f"frame-{k:05d}.png").write_bytes(image)
+
+    num_frames = 0
+    try:
+        for k, image in results:
+            output(k, image)
+            num_frames += 1
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    return num_frames
+
+
+def _chain(first, rest):
+    yield first
+    yield from rest
+
+
+def _map_in_order(executor, function, tasks, max_pending):
+    """like executor.map, but only taking a few tasks from the iterator at a time, so
+    that a long series of rasters doesn’t all have to be in memory at once
+    """
+    pending = deque()
+    for task in tasks:
+        pending.append(executor.submit(function, task))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while len(pending) > 0:
+        yield pending.popleft().result()
+
+
+def _create_frame_figure(context):
+    """set up a blank figure laid out exactly like every other frame"""
+    figure = Figure(figsize=context["figsize"], dpi=context["dpi"], facecolor="none")
+    FigureCanvasAgg(figure)
+    ax = figure.subplots()
+    turn_off_labels(ax)
+    if context["render_mode"] == "image":
+        ax.set_aspect(
+            "equal"
+        )  # imshow would set this on the raster’s figure but not the overlays’
+    return figure, ax
+
+
+def _render_figure(figure, ax, extent):
+    """draw a frame’s figure, with the axes fit to the map
+    :return: the image, as an RGBA array of floats between 0 and 1
+    """
+    ax.set_xlim(extent[0], extent[1])
+    ax.set_ylim(extent[2], extent[3])
+    figure.canvas.draw()
+    return np.asarray(figure.canvas.buffer_rgba(), dtype=np.float32) / 255
+
+
+_frame_context = None
+
+
+def _initialize_frame_worker(context):
+    """receive everything needed to draw frames, in a freshly started worker process"""
+    global _frame_context
+    _frame_context = context
+
+
+def _render_frame(task):
+    """draw one frame’s raster and lay the overlays over it, in a worker process
+    :param task: the frame’s index and raster
+    :return: the frame’s index and PNG image
+    """
+    k, raster = task
+    context = _frame_context
+    raster = np.asarray(raster)
+    if raster.shape != context["shape"]:
+        raise ValueError(
+            f"frame {k} is {raster.shape[0]}×{raster.shape[1]}, but the first frame "
+            f"was {context['shape'][0]}×{context['shape'][1]}"
+        )
+    figure, ax = _create_frame_figure(context)
+    if context["background_color"] is not None:
+        ax.patch.set_facecolor(context["background_color"])
+    if context["render_mode"] == "image":
+        lookup_table = context["lookup_table"]
+        ax.imshow(
+            np.ma.masked_array(raster.ravel()[lookup_table], context["hidden"]),
+            extent=context["extent"],
+            origin="lower",
+            interpolation="nearest",
+            cmap=context["cmap"],
+            norm=context["norm"],
+            alpha=context["alpha"],
+            zorder=1,
+        )
+    else:
+        ax.scatter(
+            x=context["xy_points"]["x"],
+            y=context["xy_points"]["y"],
+            c=raster.ravel()[context["indices"]],
+            edgecolors="none",
+            s=context["pixel_size"],
+            cmap=context["cmap"],
+            norm=context["norm"],
+            alpha=context["alpha"],
+            zorder=1,
+        )
+    image = _composite(
+        context["overlay_image"], _render_figure(figure, ax, context["extent"])
+    )
+    png = io.BytesIO()
+    mpimage.imsave(png, image, format="png")
+    return k, png.getvalue()
+
+
+def _composite(top, bottom):
+    """lay one RGBA image over another
+    :param top: the image in front, as an array of floats between 0 and 1 (not
+                premultiplied)
+    :param bottom: the image behind, in the same format
+    :return: the combined image, as an array of bytes
+    """
+    top_alpha, bottom_alpha = top[..., 3:], bottom[..., 3:]
+    alpha = top_alpha + bottom_alpha * (1 - top_alpha)
+    color = (
+        top[..., :3] * top_alpha + bottom[..., :3] * bottom_alpha * (1 - top_alpha)
+    ) / np.where(alpha > 0, alpha, 1)
+    return np.round(np.concatenate([color, alpha], axis=-1) * 255).astype(np.uint8)
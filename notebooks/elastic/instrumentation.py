@@ -0,0 +1,204 @@
+import cProfile
+import functools
+import io
+import json
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import nullcontext
+from typing import Any, Callable, Optional
+
+_NO_STAGE = nullcontext()
+_active: Optional["Instrumentation"] = None
+_pending_messages: list[str] = []  # messages logged while nothing was listening
+
+
+class Instrumentation:
+    def __init__(
+        self,
+        trace_memory: bool = False,
+        profile: bool = False,
+        on_stage: Optional[Callable[[dict[str, Any]], None]] = None,
+    ):
+        """a record of how long each stage of a render took.  while one of these is open
+        (as a context manager), plot_elastic, add_data_to_ax, project, and
+        load_elastic_projection report each of their stages to it; the rest of the time,
+        they report to nothing, which costs next to nothing.
+        :param trace_memory: whether to measure each stage’s peak memory with
+                             tracemalloc (which slows everything down considerably).
+                             tracemalloc only has one peak for the whole process, so a
+                             stage that runs at the same time as a stage in another
+                             thread gets no peak memory.
+        :param profile: whether to run cProfile the whole time it’s open
+        :param on_stage: a function to call with each stage’s record as soon as the
+                         stage finishes
+        """
+        self.trace_memory = trace_memory
+        self.profiler = cProfile.Profile() if profile else None
+        self.on_stage = on_stage
+        self.stages: list[dict[str, Any]] = []
+        self.messages: list[str] = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._all_open_stages: list[dict[str, Any]] = []  # in every thread
+        self._started_tracing = False
+        self._previous: Optional[Instrumentation] = None
+
+    def __enter__(self) -> "Instrumentation":
+        global _active
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        if self.profiler is not None:
+            self.profiler.enable()
+        self._previous, _active = _active, self
+        self.messages += _pending_messages
+        _pending_messages.clear()
+        return self
+
+    def __exit__(self, *exception_info) -> None:
+        global _active
+        _active = self._previous
+        if self.profiler is not None:
+            self.profiler.disable()
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def _get_open_stages(self) -> list[dict[str, Any]]:
+        """get the stages that are in progress in this thread, outermost first"""
+        if not hasattr(self._local, "open_stages"):
+            self._local.open_stages = []
+        return self._local.open_stages
+
+    def _update_peaks(self) -> None:
+        """fold the memory peak since the last update into every stage in progress"""
+        if tracemalloc.is_tracing():
+            _, peak = tracemalloc.get_traced_memory()
+            for record in self._get_open_stages():
+                record["_peak"] = max(record["_peak"], peak)
+            tracemalloc.reset_peak()
+
+    def start_stage(self, name: str, count: Optional[int]) -> dict[str, Any]:
+        open_stages = self._get_open_stages()
+        self._update_peaks()
+        record = dict(
+            name=f"{open_stages[-1]['name']}/{name}" if len(open_stages) > 0 else name,
+            depth=len(open_stages),
+            count=count,
+            thread=threading.current_thread().name,
+            _start=time.perf_counter(),
+            _memory=(
+                tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+            ),
+            _peak=0,
+            _thread=threading.get_ident(),
+            _overlapped=False,
+        )
+        open_stages.append(record)
+        with self._lock:
+            # the peak is shared by every thread, so overlapping stages can’t trust it
+            for other in self._all_open_stages:
+                if other["_thread"] != record["_thread"]:
+                    other["_overlapped"] = record["_overlapped"] = True
+            self._all_open_stages.append(record)
+        return record
+
+    def finish_stage(self, record: dict[str, Any]) -> None:
+        self._update_peaks()
+        self._get_open_stages().remove(record)
+        with self._lock:
+            self._all_open_stages.remove(record)
+        record["seconds"] = time.perf_counter() - record.pop("_start")
+        memory, peak = record.pop("_memory"), record.pop("_peak")
+        del record["_thread"]
+        overlapped = record.pop("_overlapped")
+        record["peak_memory"] = (
+            max(0, peak - memory)
+            if tracemalloc.is_tracing() and not overlapped
+            else None
+        )
+        with self._lock:
+            self.stages.append(record)
+        if self.on_stage is not None:
+            self.on_stage(record)
+
+    def log(self, message: str) -> None:
+        with self._lock:
+            self.messages.append(message)
+
+    def get_report(self, num_functions: int = 30) -> dict[str, Any]:
+        """summarize everything recorded so far
+        :param num_functions: how many of the slowest functions to include, if it was
+                              profiling
+        :return: the stages (in the order they finished, each with its name, nesting
+                 depth, number of points, thread, wall time (s), and peak memory above
+                 where it started (bytes), which is None if it wasn’t tracing memory or
+                 the stage overlapped one in another thread), the log messages, and (if
+                 it was profiling) the cProfile stats
+        """
+        report: dict[str, Any] = dict(
+            stages=list(self.stages), messages=list(self.messages)
+        )
+        if self.profiler is not None:
+            stream = io.StringIO()
+            stats = pstats.Stats(self.profiler, stream=stream)
+            stats.sort_stats("cumulative").print_stats(num_functions)
+            report["profile"] = stream.getvalue()
+        return report
+
+    def to_json(self, **kwargs) -> str:
+        return json.dumps(self.get_report(), **kwargs)
+
+
+class _Stage:
+    def __init__(
+        self, instrumentation: Instrumentation, name: str, count: Optional[int]
+    ):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.count = count
+
+    def __enter__(self) -> None:
+        self.record = self.instrumentation.start_stage(self.name, self.count)
+
+    def __exit__(self, *exception_info) -> None:
+        self.instrumentation.finish_stage(self.record)
+
+
+def stage(name: str, count: Optional[int] = None):
+    """mark a block of code as a stage to report to the open Instrumentation, if there
+    is one
+    :param name: what to call the stage; it gets prefixed with the name of the stage
+                 it’s in
+    :param count: the number of points (or cells, or features) it processes, if that’s
+                  meaningful
+    """
+    if _active is None:
+        return _NO_STAGE
+    return _Stage(_active, name, count)
+
+
+def staged(name: str):
+    """mark a whole function as a stage to report to the open Instrumentation"""
+
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return function(*args, **kwargs)
+            with _Stage(_active, name, None):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def log(message: str) -> None:
+    """pass a message to the open Instrumentation, or hold it for the next one"""
+    if _active is not None:
+        _active.log(message)
+    elif len(_pending_messages) < 100:
+        _pending_messages.append(message)
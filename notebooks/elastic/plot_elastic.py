@@ -2,15 +2,44 @@ import matplotlib.colors as mpcolors
 import matplotlib.cm as mpcm
 import matplotlib.pyplot as plt
 import numpy as np
+import scipy.sparse
 from numpy import newaxis
-from math import sqrt
+from math import ceil, pi, sqrt
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path as FilePath
+import hashlib
+import os
+import tempfile
 
 from core import (
+    CHUNK_SIZE,
+    OVERLAY_CACHE_DIR,
+    REGRIDDING_CACHE_DIR,
     ΦΛPoint,
+    XYPoint,
+    OverlayCache,
     load_elastic_projection,
+    load_bounding_box,
     add_data_to_ax,
-    rotate_points,
+    load_projected_data,
+    draw_projected_data,
     project_points,
+    UnprojectablePointsError,
+    inverse_project_points,
+    iterate_chunks,
+    hash_file,
+    get_viewport_region,
+    cull_sections,
+)
+from instrumentation import stage, staged, log
+
+EARTH_RADIUS = 6371.0  # the mean radius of the earth (km)
+REGRIDDING_SAMPLES = (
+    8  # the fewest points along each side of a raster cell when regridding
+)
+REGRIDDING_SAMPLES_PER_PIXEL = (
+    4  # the fewest points along each side of a pixel when regridding
 )
 
 
@@ -32,6 +61,458 @@ def create_latlon_raster(raster):
     return latlon_raster
 
 
+@lru_cache(maxsize=8)
+def create_raster_lookup_table(
+    shape, projection_path, resolution, rotation_deg=0, extent=None, region=None
+):
+    """work out which cell of a lat/lon raster shows up in each pixel of a projected
+    image
+    :param shape: the number of rows and columns in the lat/lon raster
+    :param projection_path: the hdf5 file that defines the projection
+    :param resolution: the width of the projected image (pixels)
+    :param rotation_deg: the angle by which the map is rotated (deg)
+    :param extent: the part of the map to cover (left, right, bottom, top) in km, if not
+                   all of it
+    :param region: the south, north, west, and east edges of a box on the globe that
+                   contains everything in the extent (deg), so that the sections outside
+                   it can be skipped
+    :return: the flat index of the raster cell for each pixel of the image, or -1 for
+             pixels that are off the map; and the image’s extent (left, right, bottom,
+             top) in km
+    """
+    sections, boundary, aspect_ratio = load_elastic_projection(
+        projection_path, rotation_deg
+    )
+    if region is not None:
+        sections = cull_sections(sections, region)
+    if extent is not None:
+        x_min, x_max, y_min, y_max = extent
+    else:
+        x_min, x_max = np.min(boundary["x"]), np.max(boundary["x"])
+        y_min, y_max = np.min(boundary["y"]), np.max(boundary["y"])
+    width = resolution
+    height = max(1, round(resolution * (y_max - y_min) / (x_max - x_min)))
+
+    pixel_centers = np.empty((height, width), dtype=XYPoint)
+    pixel_centers["x"] = (
+        x_min + (np.arange(width)[newaxis, :] + 0.5) * (x_max - x_min) / width
+    )
+    pixel_centers["y"] = (
+        y_min + (np.arange(height)[:, newaxis] + 0.5) * (y_max - y_min) / height
+    )
+    latlon, inside = inverse_project_points(pixel_centers.ravel(), sections, boundary)
+
+    lookup_table = get_raster_indices(latlon, inside, shape).reshape((height, width))
+    return lookup_table, (x_min, x_max, y_min, y_max)
+
+
+def get_raster_indices(latlon, inside, shape):
+    """find the flat index of the lat/lon raster cell that contains each point
+    :param latlon: the latitudes and longitudes (deg)
+    :param inside: whether each point is actually on the map
+    :param shape: the number of rows and columns in the lat/lon raster
+    :return: the flat index of each point’s cell, or -1 for points that are off the map
+    """
+    n_lat, n_lon = shape
+    i = np.floor((latlon["latitude"] + 90) / 180 * n_lat)
+    j = np.floor((latlon["longitude"] + 180) / 360 * n_lon)
+    i = np.clip(np.nan_to_num(i), 0, n_lat - 1).astype(int)
+    j = np.clip(np.nan_to_num(j), 0, n_lon - 1).astype(int)
+    return np.where(inside, i * n_lon + j, -1)
+
+
+def get_map_extent(projection_path, rotation_deg=0):
+    """find the rectangle on the projected plane that contains the whole map: the hdf5
+    file’s bounding box, stretched to cover the projected boundary (some bounding boxes
+    don’t quite)
+    :param projection_path: the hdf5 file that defines the projection
+    :param rotation_deg: the angle by which the map is rotated (deg)
+    :return: the left, right, bottom, and top edges of the map (km)
+    """
+    _, boundary, _ = load_elastic_projection(projection_path, rotation_deg)
+    x_min, x_max, y_min, y_max = load_bounding_box(projection_path, rotation_deg)
+    return (
+        min(x_min, float(np.nanmin(boundary["x"]))),
+        max(x_max, float(np.nanmax(boundary["x"]))),
+        min(y_min, float(np.nanmin(boundary["y"]))),
+        max(y_max, float(np.nanmax(boundary["y"]))),
+    )
+
+
+def get_km_per_pixel(ax, projection_path, rotation_deg=0, extent=None):
+    """work out how much of the map each pixel of an ax covers, assuming the map fills
+    the ax
+    :param projection_path: the hdf5 file that defines the projection
+    :param rotation_deg: the angle by which the map is rotated (deg)
+    :param extent: the part of the map the ax shows (left, right, bottom, top) in km, if
+                   not all of it
+    :return: the width or height of a pixel, whichever is smaller (km)
+    """
+    if extent is None:
+        extent = get_map_extent(projection_path, rotation_deg)
+    x_min, x_max, y_min, y_max = extent
+    window = ax.get_window_extent()
+    return min((x_max - x_min) / window.width, (y_max - y_min) / window.height)
+
+
+def get_pixel_indices(xy_points, extent, shape):
+    """find the flat index of the pixel of a projected image that contains each point
+    :param xy_points: the x and y coordinates (km)
+    :param extent: the left, right, bottom, and top edges of the image (km)
+    :param shape: the number of rows and columns of pixels in the image
+    :return: the flat index of each point’s pixel, or -1 for points that are off the
+             image
+    """
+    x_min, x_max, y_min, y_max = extent
+    height, width = shape
+    j = np.floor((xy_points["x"] - x_min) / (x_max - x_min) * width)
+    i = np.floor((xy_points["y"] - y_min) / (y_max - y_min) * height)
+    # points exactly on the top or right edge go in the last pixel
+    j = np.where(xy_points["x"] == x_max, width - 1, j)
+    i = np.where(xy_points["y"] == y_max, height - 1, i)
+    on_grid = (i >= 0) & (i < height) & (j >= 0) & (j < width)
+    return np.where(on_grid, i * width + j, -1).astype(int)
+
+
+class DensityAccumulator:
+    def __init__(self, projection_path, resolution=2000, rotation_deg=0):
+        """a histogram on the projected plane that you can add points to a chunk at a
+        time, so that you can map any number of positions without ever holding more than
+        one chunk of them (and the histogram itself) in memory.  accumulators that cover
+        the same grid can be merged, so you can have a bunch of workers each bin part of
+        the data and then add them up.
+        :param projection_path: the hdf5 file that defines the projection
+        :param resolution: the number of pixels across the histogram
+        :param rotation_deg: the angle by which the map is rotated (deg)
+        """
+        self.projection_path = str(projection_path)
+        self.rotation_deg = rotation_deg
+        self.extent = get_map_extent(projection_path, rotation_deg)
+        x_min, x_max, y_min, y_max = self.extent
+        self.shape = (
+            max(1, round(resolution * (y_max - y_min) / (x_max - x_min))),
+            resolution,
+        )
+        self.totals = np.zeros(self.shape)
+        self.num_points = 0
+
+    def add(self, points, weights=None, chunk_size=CHUNK_SIZE):
+        """project some points and add them to the histogram
+        :param points: the latitudes and longitudes, as an array, the path to a file of
+                       points, or an iterable of chunks.  if the records have a "weight"
+                       field, that’s used as the weights.
+        :param weights: the weight of each point, if they’re not all 1 and not in the
+                        records.  this can only be used with an array of points.
+        :param chunk_size: the most points to project at once
+        :return: this accumulator
+        :raise ValueError: if weights are given for a file or an iterable of chunks, or
+                           if there isn’t one for each point
+        """
+        if weights is not None:
+            if not isinstance(points, np.ndarray):
+                raise ValueError(
+                    "weights can only be given with an array of points; to weight the "
+                    'points in a file or a series of chunks, give them a "weight" field'
+                )
+            weights = np.ravel(weights)
+            if weights.size != points.size:
+                raise ValueError(
+                    f"there are {points.size} points but {weights.size} weights"
+                )
+        sections, _, _ = load_elastic_projection(
+            self.projection_path, self.rotation_deg
+        )
+        for start, chunk in iterate_chunks(points, chunk_size):
+            if weights is not None:
+                chunk_weights = weights[start : start + chunk.size]
+            elif chunk.dtype.names is not None and "weight" in chunk.dtype.names:
+                chunk_weights = chunk["weight"]
+            else:
+                chunk_weights = None
+            xy_points = project_points(chunk, sections, first_index=start)
+            self.add_projected(xy_points, chunk_weights)
+        return self
+
+    def add_projected(self, xy_points, weights=None):
+        """add some points that have already been projected (and rotated) to the
+        histogram
+        :param xy_points: the x and y coordinates (km)
+        :param weights: the weight of each point, if they’re not all 1
+        """
+        indices = get_pixel_indices(xy_points, self.extent, self.shape)
+        on_grid = indices >= 0
+        indices = indices[on_grid]
+        if weights is not None:
+            weights = np.asarray(weights, dtype=float)[on_grid]
+        self.totals += np.bincount(
+            indices, weights, minlength=self.totals.size
+        ).reshape(self.shape)
+        self.num_points += int(np.count_nonzero(on_grid))
+
+    def merge(self, other):
+        """add another accumulator’s histogram to this one’s
+        :param other: an accumulator with the same grid
+        :return: this accumulator
+        """
+        if other.shape != self.shape or other.extent != self.extent:
+            raise ValueError(
+                "these accumulators don’t have the same grid, so they can’t be merged"
+            )
+        self.totals += other.totals
+        self.num_points += other.num_points
+        return self
+
+
+class ConservativeRegridder:
+    def __init__(
+        self,
+        projection_path,
+        shape,
+        resolution=2000,
+        rotation_deg=0,
+        samples_per_cell=None,
+        cache_dir=REGRIDDING_CACHE_DIR,
+    ):
+        """a sparse matrix that spreads each cell of a lat/lon raster over the pixels of
+        a projected image in proportion to how much of the cell’s area falls in each
+        one.  unlike scattering the cell centers, this leaves no gaps or overlaps
+        wherever the projection stretches or squashes things, and it conserves totals.
+        building the matrix means projecting a grid of points in every cell, so it’s
+        saved in cache_dir and reused for every raster of the same shape on the same
+        grid; after that, each raster takes a single sparse matrix-vector product.
+        :param projection_path: the hdf5 file that defines the projection
+        :param shape: the number of rows and columns in the lat/lon rasters
+        :param resolution: the number of pixels across the image (it covers the same
+                           area as a DensityAccumulator’s)
+        :param rotation_deg: the angle by which the map is rotated (deg)
+        :param samples_per_cell: the number of points along each side of each raster
+                                 cell to use when measuring overlaps; each overlap is
+                                 accurate to about half a sample spacing along each
+                                 side.  by default it’s at least REGRIDDING_SAMPLES, and
+                                 enough for there to be REGRIDDING_SAMPLES_PER_PIXEL
+                                 points per pixel where the cells are widest.
+        :param cache_dir: the folder in which to save the matrices, or None to not save
+                          them
+        """
+        self.projection_path = str(projection_path)
+        self.rotation_deg = rotation_deg
+        self.source_shape = tuple(shape)
+        self.extent = get_map_extent(projection_path, rotation_deg)
+        x_min, x_max, y_min, y_max = self.extent
+        self.shape = (
+            max(1, round(resolution * (y_max - y_min) / (x_max - x_min))),
+            resolution,
+        )
+        n_lat, n_lon = self.source_shape
+        if samples_per_cell is None:
+            cell_size = max(pi * EARTH_RADIUS / n_lat, 2 * pi * EARTH_RADIUS / n_lon)
+            samples_per_cell = max(
+                REGRIDDING_SAMPLES,
+                ceil(
+                    REGRIDDING_SAMPLES_PER_PIXEL
+                    * cell_size
+                    / ((x_max - x_min) / resolution)
+                ),
+            )
+        self.samples_per_cell = samples_per_cell
+
+        # the area of every cell on the globe (km²)
+        sin_ф_edges = np.sin(np.radians(np.linspace(-90, 90, n_lat + 1)))
+        self.cell_areas = np.repeat(
+            EARTH_RADIUS**2 * np.radians(360 / n_lon) * np.diff(sin_ф_edges), n_lon
+        )
+
+        matrix = None
+        if cache_dir is not None:
+            path = FilePath(cache_dir) / f"{self.get_key()}.npz"
+            if path.is_file():
+                try:
+                    matrix = scipy.sparse.load_npz(path).tocsr()
+                except (
+                    OSError,
+                    ValueError,
+                ):  # if the file is corrupted, treat it as a miss
+                    matrix = None
+            log(
+                f"regridding cache {'hit' if matrix is not None else 'miss'} for "
+                f"{self.source_shape} on {self.shape}"
+            )
+        if matrix is None:
+            with stage("build regridding matrix", n_lat * n_lon * samples_per_cell**2):
+                matrix = self.build_matrix()
+            if cache_dir is not None:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                # write it to a temporary file first so no one sees a partial one
+                file, temporary = tempfile.mkstemp(
+                    dir=path.parent, prefix=".partial-", suffix=".npz"
+                )
+                os.close(file)
+                scipy.sparse.save_npz(temporary, matrix)
+                os.replace(temporary, path)
+        self.matrix = matrix
+        # the area of the globe in each pixel (km²)
+        self.pixel_areas = (self.matrix @ self.cell_areas).reshape(self.shape)
+
+    def get_key(self):
+        """work out the name of the file in which to save this grid’s matrix"""
+        hasher = hashlib.sha256()
+        hasher.update(hash_file(self.projection_path).encode())
+        hasher.update(
+            repr(
+                (
+                    float(self.rotation_deg),
+                    self.source_shape,
+                    self.shape,
+                    self.samples_per_cell,
+                )
+            ).encode()
+        )
+        return hasher.hexdigest()[:32]
+
+    def build_matrix(self):
+        """measure how much of each cell falls in each pixel by projecting a grid of
+        points in each cell, spaced so that each one stands for the same area
+        :return: a sparse matrix with a row for each pixel and a column for each cell,
+                 whose entries are the fraction of the cell’s area that falls in the
+                 pixel.  the rare points that the projection can’t place are left out,
+                 so a few columns may add up to slightly less than 1.
+        """
+        sections, _, _ = load_elastic_projection(
+            self.projection_path, self.rotation_deg
+        )
+        n_lat, n_lon = self.source_shape
+        samples = self.samples_per_cell
+        offsets = (np.arange(samples) + 0.5) / samples
+        sin_ф_edges = np.sin(np.radians(np.linspace(-90, 90, n_lat + 1)))
+        λ = -180 + (np.arange(n_lon)[:, newaxis] + offsets[newaxis, :]) * 360 / n_lon
+        rows_per_chunk = max(1, CHUNK_SIZE // (n_lon * samples**2))
+        num_cells = n_lat * n_lon
+        keys, counts = [], []
+        for start in range(0, n_lat, rows_per_chunk):
+            rows = np.arange(start, min(n_lat, start + rows_per_chunk))
+            sin_ф = (
+                sin_ф_edges[rows, newaxis]
+                + offsets[newaxis, :] * np.diff(sin_ф_edges)[rows, newaxis]
+            )
+            points = np.empty((rows.size, samples, n_lon, samples), dtype=ΦΛPoint)
+            points["latitude"] = np.degrees(np.arcsin(sin_ф))[:, :, newaxis, newaxis]
+            points["longitude"] = λ[newaxis, newaxis, :, :]
+            cells = np.broadcast_to(
+                rows[:, newaxis, newaxis, newaxis] * n_lon
+                + np.arange(n_lon)[newaxis, newaxis, :, newaxis],
+                points.shape,
+            ).ravel()
+            points = points.ravel()
+            try:
+                xy_points = project_points(points, sections)
+            except UnprojectablePointsError as error:
+                # leave out the points that the projection can’t place
+                projectable = np.full(points.size, True)
+                projectable[error.indices] = False
+                xy_points = np.full(points.size, np.nan, dtype=XYPoint)
+                xy_points[projectable] = project_points(points[projectable], sections)
+            pixels = get_pixel_indices(xy_points, self.extent, self.shape)
+            on_grid = pixels >= 0
+            chunk_keys, chunk_counts = np.unique(
+                pixels[on_grid] * num_cells + cells[on_grid], return_counts=True
+            )
+            keys.append(chunk_keys)
+            counts.append(chunk_counts)
+        keys, counts = np.concatenate(keys), np.concatenate(counts)
+        return scipy.sparse.csr_matrix(
+            (counts / samples**2, (keys // num_cells, keys % num_cells)),
+            shape=(self.shape[0] * self.shape[1], num_cells),
+        )
+
+    def regrid_totals(self, raster, mask=None):
+        """add up a raster of amounts (like fishing hours) in each pixel, splitting each
+        cell’s amount among the pixels it overlaps in proportion to area, so that the
+        grand total is the same
+        :param raster: the amount in each cell; NaNs count as zero
+        :param mask: which cells to include, if not all of them
+        :return: the amount in each pixel
+        """
+        values = self._get_valid_values(raster, mask)[0]
+        return (self.matrix @ values).reshape(self.shape)
+
+    def regrid_density(self, raster, mask=None):
+        """work out the density of a raster of amounts in each pixel
+        :param raster: the amount in each cell; NaNs count as zero
+        :param mask: which cells to include, if not all of them
+        :return: the amount per km² in each pixel, or NaN for pixels that are off the
+                 map
+        """
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(
+                self.pixel_areas > 0,
+                self.regrid_totals(raster, mask) / self.pixel_areas,
+                np.nan,
+            )
+
+    def regrid_mean(self, raster, mask=None):
+        """average a raster of intensive values (like a density or a fraction) in each
+        pixel, weighting each cell by how much of its area falls in the pixel
+        :param raster: the value in each cell; NaNs are left out
+        :param mask: which cells to include, if not all of them
+        :return: the average value in each pixel, or NaN for pixels with no valid cells
+                 in them
+        """
+        values, valid = self._get_valid_values(raster, mask)
+        totals = self.matrix @ (values * self.cell_areas)
+        if np.all(valid):
+            areas = self.pixel_areas.ravel()
+        else:
+            areas = self.matrix @ np.where(valid, self.cell_areas, 0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(areas > 0, totals / areas, np.nan).reshape(self.shape)
+
+    def _get_valid_values(self, raster, mask):
+        """flatten a raster, replacing the masked and invalid values with zeros
+        :return: the values, and whether each one is valid
+        """
+        if raster.shape != self.source_shape:
+            raise ValueError(
+                f"this regridder is for {self.source_shape[0]}×{self.source_shape[1]} "
+                f"rasters, but this one is {raster.shape[0]}×{raster.shape[1]}"
+            )
+        values = np.ma.filled(
+            np.ma.masked_invalid(raster).astype(float), np.nan
+        ).ravel()
+        valid = np.isfinite(values)
+        if mask is not None:
+            assert raster.shape == mask.shape
+            valid &= mask.ravel()
+        return np.where(valid, values, 0), valid
+
+
+@lru_cache(maxsize=4)
+def get_conservative_regridder(
+    projection_path, shape, resolution, rotation_deg=0, cache_dir=REGRIDDING_CACHE_DIR
+):
+    """load (or build) the ConservativeRegridder for some raster shape, keeping the last
+    few in memory
+    """
+    return ConservativeRegridder(
+        projection_path, shape, resolution, rotation_deg, cache_dir=cache_dir
+    )
+
+
+def add_density_to_ax(
+    ax, accumulator, cmap=mpcm.plasma, norm=None, alpha=1.0, zorder=1
+):
+    """draw an accumulated histogram as an image, leaving empty pixels transparent"""
+    return ax.imshow(
+        np.ma.masked_equal(accumulator.totals, 0),
+        extent=accumulator.extent,
+        origin="lower",
+        interpolation="nearest",
+        cmap=cmap,
+        norm=norm,
+        alpha=alpha,
+        zorder=zorder,
+    )
+
+
 def turn_off_labels(ax):
     ax.spines["top"].set_visible(False)
     ax.spines["right"].set_visible(False)
@@ -75,7 +556,7 @@ def add_labels_to_ax(ax, sections, dpi):
         line["latitude"] = [lat]
         line["longitude"] = [lon]
         xy = project_points(line, sections)[0]
-        plt.text(
+        ax.text(
             xy["x"] + dx,
             xy["y"] + dy,
             label,
@@ -94,7 +575,8 @@ def add_labels_to_ax(ax, sections, dpi):
             (34.3, 29.2),
             (50, 200),
             # "arc3,rad=0.3"
-            f"arc,angleA=180,angleB=0,armA={scale * 200},armB={scale * 1000},rad={scale * 100}",
+            f"arc,angleA=180,angleB=0,"
+            f"armA={scale * 200},armB={scale * 1000},rad={scale * 100}",
         ),
         (
             (-81, 9),
@@ -102,14 +584,16 @@ def add_labels_to_ax(ax, sections, dpi):
             (-83, 9),
             (-100, -400),
             # "arc3,rad=-0.3"
-            f"arc,angleA=180,angleB=0,armA={scale * 700},armB={scale * 800},rad={scale * 100}",
+            f"arc,angleA=180,angleB=0,"
+            f"armA={scale * 700},armB={scale * 800},rad={scale * 100}",
         ),
         (
             (-168, 66),
             (-50, 100),
             (-168, 60),
             (1450, 0),
-            f"arc,angleA=-90,angleB=-90,armA={scale * 1100},armB={scale * 1360},rad={scale * 100}",
+            f"arc,angleA=-90,angleB=-90,"
+            f"armA={scale * 1100},armB={scale * 1360},rad={scale * 100}",
         ),
     ]:
         line = np.zeros([2], dtype=ΦΛPoint)
@@ -137,6 +621,7 @@ def add_labels_to_ax(ax, sections, dpi):
         )
 
 
+@staged("plot_elastic")
 def plot_elastic(
     foreground_raster,
     mask=None,
@@ -155,29 +640,75 @@ def plot_elastic(
     ax=None,
     alpha=1.0,
     zorder=1,
-    nominal_pixel_size=0.72, 
+    nominal_pixel_size=0.72,
     rotation_deg=0,
     add_labels=True,
+    render_mode="scatter",
+    overlay_cache_dir=OVERLAY_CACHE_DIR,
+    simplification_tolerance=0.5,
+    regridding_cache_dir=REGRIDDING_CACHE_DIR,
+    pipeline_overlays=True,
+    viewport=None,
 ):
+    """draw a lat/lon raster on an Elastic projection
+    :param render_mode: "scatter" to draw each raster cell as a marker, or "image" to
+                        warp the raster into a single image whose width is `resolution`
+                        pixels, or "conservative" to draw an image whose width is
+                        `resolution` pixels where each pixel is the area-weighted
+                        average of the raster cells it overlaps
+    :param overlay_cache_dir: the folder in which to cache the projected shorelines,
+                              rivers, and lakes, or None to project them from scratch
+                              every time
+    :param simplification_tolerance: how far the shorelines, rivers, and lakes may stray
+                                     from their true positions, in output pixels, so
+                                     that vertices too close together to see can be
+                                     dropped; None to draw every vertex
+    :param regridding_cache_dir: the folder in which to save the "conservative" render
+                                 mode’s regridding matrices, or None to build them from
+                                 scratch every time
+    :param pipeline_overlays: whether to load and project the shorelines, rivers, and
+                              lakes on background threads while the raster is being
+                              drawn, rather than one after another once it’s done.
+                              either way they’re drawn in the same order, so they come
+                              out the same.
+    :param viewport: the part of the map to show, if not all of it: either a box on the
+                     globe, as dict(latitude=(south, north), longitude=(west, east))
+                     (deg), or a box on the projected plane, as dict(x=(left, right),
+                     y=(bottom, top)) (km).  the raster cells, overlay features, and
+                     sections that don’t show up in it are skipped (except in the
+                     "conservative" render mode, which regrids the whole raster).
+    """
     h, w = foreground_raster.shape
     projection_path = f"../../projection/{projection_name}.h5"
     sections, boundary, aspect_ratio = load_elastic_projection(projection_path)
-    latlon_raster = create_latlon_raster(foreground_raster)
-    if mask is not None:
-        assert foreground_raster.shape == mask.shape
-        latlon_raster = latlon_raster[mask]
-        foreground_raster = foreground_raster[mask]
-    xy_points = project_points(latlon_raster.flatten(), sections)
-
-    pixel_size = nominal_pixel_size * 3600 / w
+    # the rotation is applied to the projection grids, once, rather than to every point
+    rotated_sections, rotated_boundary, _ = load_elastic_projection(
+        projection_path, rotation_deg
+    )
+    if viewport is not None:
+        view_extent, region = get_viewport_region(
+            viewport, rotated_sections, rotated_boundary
+        )
+        x_min, x_max, y_min, y_max = view_extent
+        # zoom the figure (and the scatter markers) in as if the whole map were that big
+        full_x_min, full_x_max, _, _ = get_map_extent(projection_path, rotation_deg)
+        view_aspect_ratio = (x_max - x_min) / (y_max - y_min)
+        zoom = (
+            (full_x_max - full_x_min)
+            / (x_max - x_min)
+            * sqrt(view_aspect_ratio / aspect_ratio)
+        )
+        aspect_ratio = view_aspect_ratio
+    else:
+        view_extent, region = None, None
+        zoom = 1
 
     if isinstance(background_color, str):
         background_color = hex_to_rgb(background_color)
 
-    z = foreground_raster.flatten()
-
-    if rotation_deg:
-        xy_points = rotate_points(xy_points, rotation_deg)
+    overlay_cache = (
+        OverlayCache(overlay_cache_dir) if overlay_cache_dir is not None else None
+    )
 
     if ax is None:
         fig, ax = plt.subplots(
@@ -192,62 +723,187 @@ def plot_elastic(
         )
         turn_off_labels(ax)
 
-    plt.scatter(
-        x=xy_points["x"],
-        y=xy_points["y"],
-        c=z,
-        edgecolors="none",
-        # marker="s",
-        s=pixel_size,
-        cmap=cmap,
-        norm=norm,
-        alpha=alpha,
-        zorder=zorder,
+    if simplification_tolerance is not None:
+        overlay_tolerance = simplification_tolerance * get_km_per_pixel(
+            ax, projection_path, rotation_deg, view_extent
+        )
+    else:
+        overlay_tolerance = None
+
+    # the overlays, from bottom to top
+    overlays = [
+        (name, data_name, style)
+        for name, color, data_name, style in [
+            (
+                "lakes",
+                add_lakes_with_color,
+                "ne_110m_lakes",
+                dict(
+                    facecolor=add_lakes_with_color,
+                    edgecolor=add_lakes_with_color,
+                    linewidth=0.2,
+                ),
+            ),
+            (
+                "rivers",
+                add_rivers_with_color,
+                "ne_50m_rivers_lake_centerlines_scale_rank",
+                dict(
+                    color=add_rivers_with_color,
+                    linewidth=0,
+                ),
+            ),
+            (
+                "shorelines",
+                add_shorelines_with_color,
+                "ne_50m_coastline",
+                dict(
+                    color=add_shorelines_with_color,
+                    linewidth=0.2,
+                ),
+            ),
+        ]
+        if color
+    ]
+    overlay_arguments = dict(
+        sections=sections,
+        rotation_deg=rotation_deg,
+        projection_path=projection_path,
+        cache=overlay_cache,
+        tolerance=overlay_tolerance,
+        region=region,
     )
+    # start loading the overlays now; they don’t depend on the raster
+    if pipeline_overlays and len(overlays) > 0:
+
+        def load_overlay(name, data_name):
+            with stage(f"load {name}"):
+                return load_projected_data(data_name, **overlay_arguments)
+
+        executor = ThreadPoolExecutor(len(overlays), thread_name_prefix="overlay")
+        overlay_futures = [
+            executor.submit(load_overlay, name, data_name)
+            for name, data_name, _ in overlays
+        ]
+        executor.shutdown(
+            wait=False
+        )  # the threads finish their tasks and then exit on their own
+    else:
+        overlay_futures = [None] * len(overlays)
+
+    if render_mode == "image":
+        with stage("raster lookup table", resolution**2):
+            lookup_table, extent = create_raster_lookup_table(
+                foreground_raster.shape,
+                projection_path,
+                resolution,
+                rotation_deg,
+                view_extent,
+                region,
+            )
+        hidden = lookup_table < 0
+        if mask is not None:
+            assert foreground_raster.shape == mask.shape
+            hidden |= ~mask.ravel()[lookup_table]
+        with stage("draw raster", lookup_table.size):
+            ax.imshow(
+                np.ma.masked_array(foreground_raster.ravel()[lookup_table], hidden),
+                extent=extent,
+                origin="lower",
+                interpolation="nearest",
+                cmap=cmap,
+                norm=norm,
+                alpha=alpha,
+                zorder=zorder,
+            )
+    elif render_mode == "scatter":
+        latlon_raster = create_latlon_raster(foreground_raster)
+        if mask is not None:
+            assert foreground_raster.shape == mask.shape
+            latlon_raster = latlon_raster[mask]
+            foreground_raster = foreground_raster[mask]
+        projected_sections = rotated_sections
+        if region is not None:
+            # only project the cells that might show up
+            ф_min, ф_max, λ_min, λ_max = region
+            in_region = (
+                (latlon_raster["latitude"] >= ф_min)
+                & (latlon_raster["latitude"] <= ф_max)
+                & (latlon_raster["longitude"] >= λ_min)
+                & (latlon_raster["longitude"] <= λ_max)
+            )
+            latlon_raster = latlon_raster[in_region]
+            foreground_raster = foreground_raster[in_region]
+            projected_sections = cull_sections(rotated_sections, region)
+        with stage("project raster", latlon_raster.size):
+            xy_points = project_points(latlon_raster.flatten(), projected_sections)
+
+        pixel_size = nominal_pixel_size * 3600 / w * zoom**2
+
+        z = foreground_raster.flatten()
+
+        with stage("draw raster", z.size):
+            plt.scatter(
+                x=xy_points["x"],
+                y=xy_points["y"],
+                c=z,
+                edgecolors="none",
+                # marker="s",
+                s=pixel_size,
+                cmap=cmap,
+                norm=norm,
+                alpha=alpha,
+                zorder=zorder,
+            )
+    elif render_mode == "conservative":
+        with stage("regridding matrix"):
+            regridder = get_conservative_regridder(
+                projection_path,
+                foreground_raster.shape,
+                resolution,
+                rotation_deg,
+                regridding_cache_dir,
+            )
+        with stage("regrid raster", foreground_raster.size):
+            image = regridder.regrid_mean(foreground_raster, mask)
+        with stage("draw raster", image.size):
+            ax.imshow(
+                np.ma.masked_invalid(image),
+                extent=regridder.extent,
+                origin="lower",
+                interpolation="nearest",
+                cmap=cmap,
+                norm=norm,
+                alpha=alpha,
+                zorder=zorder,
+            )
+    else:
+        raise ValueError(f"unrecognized render mode: '{render_mode}'")
 
     if background_color is not None:
         ax.patch.set_facecolor(background_color)
 
     # Alpha is really used for toning down colors, so just push toward black
-    if add_lakes_with_color:
-        add_data_to_ax(
-            ax,
-            "ne_110m_lakes",
-            dict(
-                facecolor=add_lakes_with_color,
-                edgecolor=add_lakes_with_color,
-                linewidth=0.2,
-            ),
-            zorder=zorder + 1,
-            sections=sections,
-            rotation_deg=rotation_deg,
-        )
-    if add_rivers_with_color:
-        add_data_to_ax(
-            ax,
-            "ne_50m_rivers_lake_centerlines_scale_rank",
-            dict(
-                color=add_rivers_with_color,
-                linewidth=0,
-            ),
-            zorder=zorder + 1,
-            sections=sections,
-            rotation_deg=rotation_deg,
-        )
-    if add_shorelines_with_color:
-        add_data_to_ax(
-            ax,
-            "ne_50m_coastline",
-            dict(
-                color=add_shorelines_with_color,
-                linewidth=0.2,
-            ),
-            zorder=zorder + 1,
-            sections=sections,
-            rotation_deg=rotation_deg,
-        )
+    for (name, data_name, style), future in zip(overlays, overlay_futures):
+        with stage(name):
+            if future is not None:
+                projected_data, closed = future.result()
+                draw_projected_data(ax, projected_data, closed, style, zorder + 1)
+            else:
+                add_data_to_ax(
+                    ax, data_name, style, zorder=zorder + 1, **overlay_arguments
+                )
 
     if add_labels:
-        add_labels_to_ax(ax, sections, dpi)
+        with stage("labels"):
+            add_labels_to_ax(ax, sections, dpi)
+
+    if view_extent is not None:
+        x_min, x_max, y_min, y_max = view_extent
+        ax.set_xlim(x_min, x_max)
+        ax.set_ylim(y_min, y_max)
+        # labels aren’t clipped by default, so the ones outside the viewport would show
+        for text in ax.texts:
+            text.set_clip_on(True)
 
     return ax
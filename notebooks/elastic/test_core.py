@@ -0,0 +1,31 @@
+import numpy as np
+
+from core import (
+    root_dir,
+    compile_elastic_projection,
+    load_bounding_box,
+    load_elastic_projection,
+)
+
+PROJECTION_PATH = root_dir / "projection/elastic-II.h5"
+
+
+def test_rotated_load_of_compiled_projection(tmp_path):
+    compiled_path = compile_elastic_projection(
+        PROJECTION_PATH, tmp_path / "elastic-II.compiled"
+    )
+    assert load_bounding_box(compiled_path) == load_bounding_box(PROJECTION_PATH)
+
+    sections, boundary, aspect_ratio = load_elastic_projection(
+        compiled_path, rotation_deg=30
+    )
+    expected_sections, expected_boundary, expected_aspect_ratio = (
+        load_elastic_projection(PROJECTION_PATH, rotation_deg=30)
+    )
+    assert len(sections) == len(expected_sections)
+    np.testing.assert_allclose(boundary["x"], expected_boundary["x"])
+    np.testing.assert_allclose(boundary["y"], expected_boundary["y"])
+    assert aspect_ratio == expected_aspect_ratio
+    assert load_bounding_box(compiled_path, 30) == load_bounding_box(
+        PROJECTION_PATH, 30
+    )
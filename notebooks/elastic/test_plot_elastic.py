@@ -0,0 +1,70 @@
+import h5py
+import numpy as np
+
+from core import ΦΛPoint, XYPoint
+from plot_elastic import ConservativeRegridder
+
+KM_PER_DEGREE = 100
+
+
+def save_plate_carree_projection(path):
+    """write a one-section projection where x and y are just proportional to λ and ф, so
+    that where each raster cell lands can be worked out by hand
+    """
+    ф_nodes = np.linspace(-90, 90, 7)
+    λ_nodes = np.linspace(-180, 180, 13)
+    xy_nodes = np.empty((ф_nodes.size, λ_nodes.size), dtype=XYPoint)
+    xy_nodes["x"] = KM_PER_DEGREE * λ_nodes[np.newaxis, :]
+    xy_nodes["y"] = KM_PER_DEGREE * ф_nodes[:, np.newaxis]
+    border = np.array(
+        [(-90, -180), (-90, 180), (90, 180), (90, -180), (-90, -180)], dtype=ΦΛPoint
+    )
+    boundary = np.array(
+        [(KM_PER_DEGREE * λ, KM_PER_DEGREE * ф) for ф, λ in border], dtype=XYPoint
+    )
+    with h5py.File(path, "w") as file:
+        file.attrs["number of sections"] = 1
+        file["section 0/latitude"] = ф_nodes
+        file["section 0/longitude"] = λ_nodes
+        file["section 0/projected points"] = xy_nodes
+        file["section 0/boundary"] = border
+        file["projected boundary"] = boundary
+        file["bounding box"] = np.array(
+            [
+                (-180 * KM_PER_DEGREE, -90 * KM_PER_DEGREE),
+                (180 * KM_PER_DEGREE, 90 * KM_PER_DEGREE),
+            ],
+            dtype=XYPoint,
+        )
+
+
+def get_overlaps(cell_edges, pixel_edges):
+    """the fraction of each cell (along its rows) in each pixel (along its columns)"""
+    lower = np.maximum(cell_edges[:-1, np.newaxis], pixel_edges[np.newaxis, :-1])
+    upper = np.minimum(cell_edges[1:, np.newaxis], pixel_edges[np.newaxis, 1:])
+    return np.maximum(0, upper - lower) / np.diff(cell_edges)[:, np.newaxis]
+
+
+def test_regridding_weights_match_the_overlaps(tmp_path):
+    projection_path = tmp_path / "plate-carree.h5"
+    save_plate_carree_projection(projection_path)
+    # 36°×51.4° cells on 45° pixels, so most cells straddle pixel edges at odd places
+    regridder = ConservativeRegridder(
+        projection_path, (5, 7), resolution=8, cache_dir=None
+    )
+    assert regridder.shape == (4, 8)
+
+    # the fraction of each cell’s area in each pixel, in sin ф along the rows and in λ
+    # along the columns
+    sin_ф = lambda ф: np.sin(np.radians(ф))
+    row_overlaps = get_overlaps(
+        sin_ф(np.linspace(-90, 90, 6)), sin_ф(np.linspace(-90, 90, 5))
+    )
+    column_overlaps = get_overlaps(np.linspace(-180, 180, 8), np.linspace(-180, 180, 9))
+    expected = np.einsum("ai,bj->ijab", row_overlaps, column_overlaps).reshape(
+        4 * 8, 5 * 7
+    )
+
+    weights = regridder.matrix.toarray()
+    np.testing.assert_allclose(weights.sum(axis=0), 1)
+    np.testing.assert_allclose(weights, expected, atol=0.05)
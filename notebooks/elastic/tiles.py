@@ -0,0 +1,455 @@
+import hashlib
+import io
+import json
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path as FilePath
+
+import matplotlib.cm as mpcm
+import matplotlib.colors as mpcolors
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.path import Path
+from matplotlib.transforms import Bbox
+from numpy import newaxis
+
+from core import (
+    OVERLAY_CACHE_DIR,
+    XYPoint,
+    OverlayCache,
+    load_elastic_projection,
+    load_projected_data,
+    draw_projected_data,
+    inverse_project_points,
+    hash_file,
+)
+from plot_elastic import hex_to_rgb, get_map_extent, get_raster_indices
+
+TILE_SIZE = 256  # the width and height of each tile (pixels)
+TILE_MARGIN = (
+    2  # how far outside a tile a feature can be and still get drawn on it (pixels)
+)
+
+
+def export_tile_pyramid(
+    foreground_raster,
+    output_path,
+    zoom_levels=range(0, 5),
+    mask=None,
+    cmap=mpcm.plasma,
+    background_color="#000000",
+    norm=mpcolors.LogNorm(vmin=1, vmax=10000, clip=True),
+    projection_name="Elastic-II",
+    overlays=(),
+    alpha=1.0,
+    rotation_deg=0,
+    tile_size=TILE_SIZE,
+    processes=None,
+    overlay_cache_dir=OVERLAY_CACHE_DIR,
+):
+    """cut a lat/lon raster on an Elastic projection into a pyramid of z/x/y tiles.  at
+    zoom level z, the square that contains the map is split into 2^z by 2^z tiles, with
+    x counting from the left and y counting from the top.  tiles that are entirely off
+    the map or that would show nothing but the background aren’t saved.  if there are
+    already tiles at output_path, any whose inputs haven’t changed are left alone rather
+    than being drawn again.
+    :param foreground_raster: the lat/lon raster to draw
+    :param output_path: either a directory in which to put z/x/y.png files, or an
+                        .mbtiles file
+    :param zoom_levels: the zoom levels to generate
+    :param mask: which raster cells to draw, if not all of them
+    :param norm: how to map the raster values to colors.  this must be the same for
+                 every tile, so it can’t autoscale.
+    :param overlays: the shapefiles to draw on top of the raster, as (data_name, style)
+                     pairs like the arguments of add_data_to_ax, from bottom to top
+    :param rotation_deg: the angle by which the map is rotated (deg)
+    :param tile_size: the width and height of each tile (pixels)
+    :param processes: the number of processes to render tiles in (by default, one per
+                      CPU)
+    :param overlay_cache_dir: the folder in which to cache the projected overlays, or
+                              None
+    :return: the number of tiles that were drawn, left unchanged, and removed
+    """
+    projection_path = f"../../projection/{projection_name}.h5"
+    sections, boundary, _ = load_elastic_projection(projection_path)
+    if isinstance(background_color, str):
+        background_color = hex_to_rgb(background_color)
+    if mask is not None:
+        assert foreground_raster.shape == mask.shape
+
+    # project every overlay once, and note where each feature is so that each tile can
+    # skip the rest
+    overlay_cache = (
+        OverlayCache(overlay_cache_dir) if overlay_cache_dir is not None else None
+    )
+    projected_overlays = []
+    for k, (data_name, style) in enumerate(overlays):
+        features, closed = load_projected_data(
+            data_name, sections, rotation_deg, projection_path, overlay_cache
+        )
+        lower, upper = features.get_envelopes()
+        projected_overlays.append((features, closed, style, k + 2, lower, upper))
+
+    x_min, x_max, y_min, y_max = get_map_extent(projection_path, rotation_deg)
+    _, rotated_boundary, _ = load_elastic_projection(projection_path, rotation_deg)
+    side = max(x_max - x_min, y_max - y_min)
+    domain = ((x_min + x_max - side) / 2, (y_min + y_max + side) / 2, side)
+
+    # anything that changes how the tiles look goes into every tile’s digest
+    hasher = hashlib.sha256()
+    hasher.update(hash_file(projection_path).encode())
+    hasher.update(
+        repr(
+            (
+                float(rotation_deg),
+                tile_size,
+                alpha,
+                background_color,
+                foreground_raster.shape,
+                str(foreground_raster.dtype),
+                cmap.name,
+                type(norm).__name__,
+                norm.vmin,
+                norm.vmax,
+                getattr(norm, "clip", None),
+                [repr(sorted(style.items())) for _, style in overlays],
+            )
+        ).encode()
+    )
+    settings_digest = hasher.hexdigest()
+
+    context = dict(
+        raster=foreground_raster,
+        mask=mask,
+        cmap=cmap,
+        norm=norm,
+        alpha=alpha,
+        background_color=background_color,
+        projection_path=projection_path,
+        rotation_deg=rotation_deg,
+        overlays=projected_overlays,
+        domain=domain,
+        tile_size=tile_size,
+        settings_digest=settings_digest,
+    )
+
+    writer = open_tile_writer(output_path)
+    try:
+        writer.set_metadata(
+            dict(
+                name=projection_name,
+                format="png",
+                minzoom=min(zoom_levels),
+                maxzoom=max(zoom_levels),
+                extent=[x_min, x_max, y_min, y_max],
+            )
+        )
+        # skip the tiles that miss the map entirely without even looking at them
+        boundary_path = Path(
+            np.stack([rotated_boundary["x"], rotated_boundary["y"]], axis=-1)
+        )
+        tiles = []
+        for z in zoom_levels:
+            tiles += find_tiles_on_map(boundary_path, domain, z)
+        counts = dict(drawn=0, unchanged=0, removed=0)
+        old_digests = writer.get_digests()
+        for tile in set(old_digests) - set(tiles):
+            if tile[0] in zoom_levels:
+                writer.remove(*tile)
+                counts["removed"] += 1
+
+        tasks = [(z, x, y, old_digests.get((z, x, y))) for z, x, y in tiles]
+        if processes == 1:
+            _initialize_tile_worker(context)
+            results = map(_render_tile, tasks)
+            executor = None
+        else:
+            executor = ProcessPoolExecutor(
+                processes, initializer=_initialize_tile_worker, initargs=(context,)
+            )
+            results = executor.map(_render_tile, tasks, chunksize=8)
+        try:
+            for (z, x, y, old_digest), (digest, image) in zip(tasks, results):
+                if digest is None:
+                    if old_digest is not None:
+                        writer.remove(z, x, y)
+                        counts["removed"] += 1
+                elif image is None:
+                    counts["unchanged"] += 1
+                else:
+                    writer.write(z, x, y, image, digest)
+                    counts["drawn"] += 1
+        finally:
+            if executor is not None:
+                executor.shutdown()
+    finally:
+        writer.close()
+    return counts
+
+
+def find_tiles_on_map(boundary_path, domain, zoom, z=0, x=0, y=0):
+    """list the tiles at some zoom level that overlap the map, skipping each tile whose
+    parent doesn’t overlap it
+    :param boundary_path: the map’s projected boundary
+    :param domain: the left edge, top edge, and width of the zoom-level-0 tile (km)
+    :return: the zoom level, x index, and y index of each tile
+    """
+    x_min, x_max, y_min, y_max = get_tile_bounds(domain, z, x, y)
+    if not boundary_path.intersects_bbox(
+        Bbox([[x_min, y_min], [x_max, y_max]]), filled=True
+    ):
+        return []
+    if z == zoom:
+        return [(z, x, y)]
+    tiles = []
+    for dy in range(2):
+        for dx in range(2):
+            tiles += find_tiles_on_map(
+                boundary_path, domain, zoom, z + 1, 2 * x + dx, 2 * y + dy
+            )
+    return tiles
+
+
+def get_tile_bounds(domain, z, x, y):
+    """find the edges of a tile
+    :param domain: the left edge, top edge, and width of the zoom-level-0 tile (km)
+    :return: the left, right, bottom, and top edges of the tile (km)
+    """
+    left, top, side = domain
+    width = side / 2**z
+    return (
+        left + x * width,
+        left + (x + 1) * width,
+        top - (y + 1) * width,
+        top - y * width,
+    )
+
+
+_tile_context = None
+
+
+def _initialize_tile_worker(context):
+    """receive everything needed to draw tiles, in a freshly started worker process"""
+    global _tile_context
+    _tile_context = context
+
+
+def _render_tile(task):
+    """draw one tile, in a worker process
+    :param task: the tile’s zoom level, x index, and y index, and the digest of its
+                 inputs the last time it was drawn (or None)
+    :return: the digest of the tile’s inputs, or None if there’s nothing on it; and the
+             PNG image, or None if there’s nothing on it or it hasn’t changed
+    """
+    z, x, y, old_digest = task
+    context = _tile_context
+    tile_size = context["tile_size"]
+    bounds = get_tile_bounds(context["domain"], z, x, y)
+    x_min, x_max, y_min, y_max = bounds
+
+    # find which raster cell falls in each pixel
+    sections, boundary, _ = load_elastic_projection(
+        context["projection_path"], context["rotation_deg"]
+    )
+    pixel_centers = np.empty((tile_size, tile_size), dtype=XYPoint)
+    pixel_centers["x"] = (
+        x_min + (np.arange(tile_size)[newaxis, :] + 0.5) * (x_max - x_min) / tile_size
+    )
+    pixel_centers["y"] = (
+        y_min + (np.arange(tile_size)[:, newaxis] + 0.5) * (y_max - y_min) / tile_size
+    )
+    latlon, inside = inverse_project_points(pixel_centers.ravel(), sections, boundary)
+    raster = context["raster"]
+    lookup_table = get_raster_indices(latlon, inside, raster.shape).reshape(
+        (tile_size, tile_size)
+    )
+    values = raster.ravel()[lookup_table]
+    hidden = lookup_table < 0
+    if context["mask"] is not None:
+        hidden |= ~context["mask"].ravel()[lookup_table]
+    hidden |= np.ma.getmaskarray(context["norm"](np.ma.masked_invalid(values)))
+
+    # find which features are close enough to show up
+    margin = TILE_MARGIN * (x_max - x_min) / tile_size
+    overlays = []
+    for features, closed, style, zorder, lower, upper in context["overlays"]:
+        nearby = np.nonzero(
+            (lower["x"] <= x_max + margin)
+            & (upper["x"] >= x_min - margin)
+            & (lower["y"] <= y_max + margin)
+            & (upper["y"] >= y_min - margin)
+        )[0]
+        if nearby.size > 0:
+            overlays.append((features.subset(nearby), closed, style, zorder))
+
+    if np.all(hidden) and len(overlays) == 0:
+        return None, None
+
+    hasher = hashlib.sha256()
+    hasher.update(context["settings_digest"].encode())
+    hasher.update(np.where(hidden, np.nan, values).astype(float).tobytes())
+    for features, closed, style, zorder in overlays:
+        hasher.update(repr(zorder).encode())
+        for array in [
+            features.points,
+            features.line_offsets,
+            features.feature_offsets,
+            features.categories,
+            features.widths,
+        ]:
+            hasher.update(np.ascontiguousarray(array).tobytes())
+    digest = hasher.hexdigest()
+    if digest == old_digest:
+        return digest, None
+
+    figure = Figure(figsize=(1, 1), dpi=tile_size)
+    FigureCanvasAgg(figure)
+    ax = figure.add_axes((0, 0, 1, 1))
+    ax.set_axis_off()
+    ax.imshow(
+        np.ma.masked_array(values, hidden),
+        extent=bounds,
+        origin="lower",
+        interpolation="nearest",
+        cmap=context["cmap"],
+        norm=context["norm"],
+        alpha=context["alpha"],
+        zorder=1,
+    )
+    for features, closed, style, zorder in overlays:
+        draw_projected_data(ax, features, closed, style, zorder)
+    ax.set_xlim(x_min, x_max)
+    ax.set_ylim(y_min, y_max)
+    image = io.BytesIO()
+    background_color = context["background_color"]
+    figure.savefig(
+        image,
+        format="png",
+        dpi=tile_size,
+        facecolor=background_color if background_color is not None else "none",
+    )
+    return digest, image.getvalue()
+
+
+def open_tile_writer(output_path):
+    """open a place to put tiles: an MBTiles archive if the path ends in .mbtiles,
+    otherwise a directory of z/x/y.png files
+    """
+    if FilePath(output_path).suffix == ".mbtiles":
+        return MBTilesWriter(output_path)
+    else:
+        return DirectoryTileWriter(output_path)
+
+
+class DirectoryTileWriter:
+    def __init__(self, directory):
+        """a folder of tiles, each at z/x/y.png, plus a manifest.json recording each
+        tile’s digest so that a later run knows which ones it can leave alone
+        """
+        self.directory = FilePath(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.manifest_path = self.directory / "manifest.json"
+        self.metadata = {}
+        self.digests = {}
+        if self.manifest_path.is_file():
+            manifest = json.loads(self.manifest_path.read_text())
+            self.metadata = manifest["metadata"]
+            for key, digest in manifest["digests"].items():
+                z, x, y = (int(index) for index in key.split("/"))
+                self.digests[(z, x, y)] = digest
+
+    def get_digests(self):
+        """get the digest of every tile that’s already here, keyed by (z, x, y)"""
+        return dict(self.digests)
+
+    def set_metadata(self, metadata):
+        self.metadata = metadata
+
+    def write(self, z, x, y, image, digest):
+        path = self.directory / f"{z}/{x}/{y}.png"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_suffix(".png.partial")
+        temporary.write_bytes(image)
+        os.replace(temporary, path)
+        self.digests[(z, x, y)] = digest
+
+    def remove(self, z, x, y):
+        (self.directory / f"{z}/{x}/{y}.png").unlink(missing_ok=True)
+        self.digests.pop((z, x, y), None)
+
+    def close(self):
+        manifest = dict(
+            metadata=self.metadata,
+            digests={
+                f"{z}/{x}/{y}": digest
+                for (z, x, y), digest in sorted(self.digests.items())
+            },
+        )
+        temporary = self.manifest_path.with_suffix(".json.partial")
+        temporary.write_text(json.dumps(manifest, indent=1))
+        os.replace(temporary, self.manifest_path)
+
+
+class MBTilesWriter:
+    def __init__(self, path):
+        """a single-file MBTiles archive (an SQLite database) of tiles, with an extra
+        table recording each tile’s digest so that a later run knows which ones it can
+        leave alone.  as MBTiles requires, rows are counted from the bottom rather than
+        the top.
+        """
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS tiles (
+                zoom_level INTEGER,
+                tile_column INTEGER,
+                tile_row INTEGER,
+                tile_data BLOB,
+                PRIMARY KEY (zoom_level, tile_column, tile_row)
+            );
+            CREATE TABLE IF NOT EXISTS tile_digests (
+                zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, digest TEXT,
+                PRIMARY KEY (zoom_level, tile_column, tile_row)
+            );
+        """)
+
+    def get_digests(self):
+        """get the digest of every tile that’s already here, keyed by (z, x, y)"""
+        rows = self.connection.execute(
+            "SELECT zoom_level, tile_column, tile_row, digest FROM tile_digests"
+        )
+        return {(z, x, 2**z - 1 - row): digest for z, x, row, digest in rows}
+
+    def set_metadata(self, metadata):
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO metadata VALUES (?, ?)",
+            [
+                (name, json.dumps(value) if not isinstance(value, str) else value)
+                for name, value in metadata.items()
+            ],
+        )
+
+    def write(self, z, x, y, image, digest):
+        row = 2**z - 1 - y
+        self.connection.execute(
+            "INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)", (z, x, row, image)
+        )
+        self.connection.execute(
+            "INSERT OR REPLACE INTO tile_digests VALUES (?, ?, ?, ?)",
+            (z, x, row, digest),
+        )
+
+    def remove(self, z, x, y):
+        row = 2**z - 1 - y
+        for table in ["tiles", "tile_digests"]:
+            self.connection.execute(
+                f"DELETE FROM {table} "
+                "WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                (z, x, row),
+            )
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()